@@ -0,0 +1,133 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from chunking import split_audio
+from workers import SharedAudio, WhisperPool
+
+# Windows are cut in pauses between these bounds so each one fits Whisper's 30s input
+WINDOW_SECONDS = 26
+WINDOW_SEARCH_SECONDS = 3
+
+
+class WhisperBatcher:
+    """Gather 30-second windows from concurrent jobs into batched Whisper decodes.
+
+    Each job's audio is split into independent windows. Windows that share a
+    model and language are collected until ``max_batch_size`` are waiting or
+    ``max_wait_ms`` has passed since the first one arrived, and then decoded
+    together in a single encoder/decoder pass on the pool.
+
+    Windows are decoded without the previous window's text as a prompt and
+    without temperature fallback, trading a little accuracy for throughput.
+    """
+
+    def __init__(self, pool: WhisperPool, max_batch_size: int = 8, max_wait_ms: float = 50):
+        self.pool = pool
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queues: Dict[Tuple[str, str], asyncio.Queue] = {}
+        self._collectors: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._in_flight: set = set()
+        self.batches = 0
+        self.windows = 0
+
+    async def transcribe(self, audio: np.ndarray | SharedAudio, model_name: Optional[str], language: str) -> Dict[str, Any]:
+        """Transcribe ``audio`` through the shared batches and return a Whisper-style result."""
+        key = (model_name or self.pool.model_name, language)
+        windows = split_audio(audio, WINDOW_SECONDS, search_seconds=WINDOW_SEARCH_SECONDS)
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for _, samples in windows:
+            future = loop.create_future()
+            self._queue_for(key).put_nowait((samples, future))
+            futures.append(future)
+
+        decoded = await asyncio.gather(*futures)
+
+        segments = []
+        for (offset, _), window in zip(windows, decoded):
+            for segment in window["segments"]:
+                segments.append({
+                    "id": len(segments),
+                    "seek": int(offset * 100),
+                    "start": round(segment["start"] + offset, 3),
+                    "end": round(segment["end"] + offset, 3),
+                    "text": segment["text"],
+                    "tokens": segment["tokens"],
+                    "temperature": window["temperature"],
+                    "avg_logprob": window["avg_logprob"],
+                    "compression_ratio": window["compression_ratio"],
+                    "no_speech_prob": window["no_speech_prob"],
+                })
+
+        return {
+            "text": "".join(segment["text"] for segment in segments),
+            "segments": segments,
+            "language": language,
+        }
+
+    def _queue_for(self, key: Tuple[str, str]) -> asyncio.Queue:
+        if key not in self._queues:
+            self._queues[key] = asyncio.Queue()
+        collector = self._collectors.get(key)
+        if collector is None or collector.done():
+            self._collectors[key] = asyncio.create_task(self._collect(key))
+        return self._queues[key]
+
+    async def _collect(self, key: Tuple[str, str]):
+        queue = self._queues[key]
+        while True:
+            batch = [await queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Decode in the background so the next batch can start filling immediately
+            task = asyncio.create_task(self._run_batch(key, batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _run_batch(self, key: Tuple[str, str], batch: List[Tuple[np.ndarray | SharedAudio, asyncio.Future]]):
+        model_name, language = key
+        live = [(samples, future) for samples, future in batch if not future.cancelled()]
+        if not live:
+            return
+
+        self.batches += 1
+        self.windows += len(live)
+        try:
+            results = await self.pool.decode_windows(model_name, [samples for samples, _ in live], language)
+        except Exception as e:
+            for _, future in live:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(live, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "windows": self.windows,
+            "average_batch_size": self.windows / self.batches if self.batches else 0.0,
+        }
+
+    async def stop(self):
+        for collector in self._collectors.values():
+            collector.cancel()
+        await asyncio.gather(*self._collectors.values(), return_exceptions=True)
+        self._collectors = {}
@@ -0,0 +1,139 @@
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def _chunk_lengths(chunk_seconds: float, first_chunk_seconds: Optional[float]) -> Iterator[int]:
+    """Yield chunk lengths in samples, doubling from ``first_chunk_seconds`` up to ``chunk_seconds``."""
+    seconds = min(first_chunk_seconds or chunk_seconds, chunk_seconds)
+    while True:
+        yield int(seconds * SAMPLE_RATE)
+        seconds = min(seconds * 2, chunk_seconds)
+
+
+def find_split_points(
+    audio: np.ndarray,
+    chunk_seconds: float = 300,
+    search_seconds: float = 20,
+    frame_ms: int = 50,
+    first_chunk_seconds: Optional[float] = None
+) -> List[int]:
+    """Pick sample offsets near every ``chunk_seconds`` that fall on the quietest audio.
+
+    For each nominal boundary the RMS energy of ``frame_ms`` frames within
+    +/- ``search_seconds`` is computed and the split is placed in the middle
+    of the lowest-energy frame, so chunks end in pauses rather than mid-word.
+    With ``first_chunk_seconds`` the chunks start short and double in length,
+    which gets the first text out quickly when results are streamed.
+    """
+    lengths = _chunk_lengths(chunk_seconds, first_chunk_seconds)
+    first_length = next(lengths)
+    if len(audio) <= first_length:
+        return []
+
+    frame_samples = int(SAMPLE_RATE * frame_ms / 1000)
+    search_samples = int(min(search_seconds, first_length / SAMPLE_RATE / 4) * SAMPLE_RATE)
+    splits = []
+
+    previous = 0
+    target = first_length
+    while target < len(audio) - search_samples:
+        lo = max(previous + frame_samples, target - search_samples)
+        hi = min(len(audio), target + search_samples)
+        window = np.asarray(audio[lo:hi], dtype=np.float32)
+        n_frames = len(window) // frame_samples
+        if n_frames == 0:
+            break
+
+        frames = window[:n_frames * frame_samples].reshape(n_frames, frame_samples)
+        energy = np.sqrt(np.mean(frames * frames, axis=1))
+        split = lo + int(np.argmin(energy)) * frame_samples + frame_samples // 2
+
+        splits.append(split)
+        previous = split
+        target = split + next(lengths)
+    return splits
+
+
+def split_audio(
+    audio: np.ndarray,
+    chunk_seconds: float = 300,
+    first_chunk_seconds: Optional[float] = None,
+    search_seconds: float = 20
+) -> List[Tuple[float, np.ndarray]]:
+    """Split ``audio`` at silence boundaries into ``(offset_seconds, samples)`` chunks."""
+    splits = find_split_points(
+        audio, chunk_seconds, search_seconds=search_seconds, first_chunk_seconds=first_chunk_seconds
+    )
+    bounds = [0] + splits + [len(audio)]
+    return [
+        (start / SAMPLE_RATE, audio[start:end])
+        for start, end in zip(bounds[:-1], bounds[1:])
+        if end > start
+    ]
+
+
+def _words(text: str) -> List[str]:
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def _trim_overlap(previous: str, current: str, min_words: int = 3) -> str:
+    """Drop the leading words of ``current`` that repeat the tail of ``previous``."""
+    prev_words = _words(previous)
+    cur_words = current.split()
+    cur_norm = _words(current)
+    if len(cur_norm) != len(cur_words):
+        # Punctuation-only tokens make positional trimming unreliable
+        return current
+
+    for size in range(min(len(prev_words), len(cur_norm)), min_words - 1, -1):
+        if prev_words[-size:] == cur_norm[:size]:
+            return " ".join(cur_words[size:])
+    return current
+
+
+class SegmentStitcher:
+    """Incrementally merge per-chunk Whisper results, in chunk order.
+
+    Segment ``start``/``end``/``seek`` are shifted by each chunk's offset,
+    ids are renumbered, and text repeated across a chunk edge is removed.
+    """
+
+    def __init__(self):
+        self.segments: List[Dict[str, Any]] = []
+        self.language: Optional[str] = None
+
+    def add(self, offset: float, result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Append the next chunk's result and return the segments it contributed."""
+        self.language = self.language or result.get("language")
+        added = []
+        for index, segment in enumerate(result.get("segments", [])):
+            segment = dict(segment)
+            segment["start"] = round(segment["start"] + offset, 3)
+            segment["end"] = round(segment["end"] + offset, 3)
+            segment["seek"] = segment.get("seek", 0) + int(offset * 100)
+
+            if index < 2 and self.segments and offset > 0:
+                previous = self.segments[-1]
+                if _words(segment["text"]) == _words(previous["text"]):
+                    continue
+                trimmed = _trim_overlap(previous["text"], segment["text"].strip())
+                if not trimmed:
+                    continue
+                if trimmed != segment["text"].strip():
+                    segment["text"] = " " + trimmed
+
+            segment["id"] = len(self.segments)
+            self.segments.append(segment)
+            added.append(segment)
+        return added
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "text": "".join(segment["text"] for segment in self.segments),
+            "segments": self.segments,
+            "language": self.language,
+        }
@@ -1,33 +1,202 @@
+import asyncio
 import json
 from datetime import datetime
-from typing import Dict, List
-from ollama import AsyncClient
+from typing import Any, AsyncIterator, Dict, List, Tuple
+from ollamaGateway import OllamaGateway
+from jsonStream import JSONItemStream
+from jsonRepair import missing_sections, repair_json
+from promptBudget import build_materials_section, estimate_tokens, rank_materials
+
+# Top-level sections of the study guide; missing ones are re-requested on their own
+STUDY_GUIDE_SECTIONS = ("modules", "overall_preparation_tips", "exam_day_guidelines")
+MODULE_SECTIONS = ("learning_objectives", "recommended_materials", "revision_strategy", "self_assessment")
+
+# Output format of one module when modules are generated separately
+MODULE_FORMAT = (
+    "{\n"
+    "    \"name\": \"Module Name\",\n"
+    "    \"learning_objectives\": [\"obj1\", \"obj2\"],\n"
+    "    \"recommended_materials\": [\n"
+    "        {\n"
+    "            \"filename\": \"material.pdf\",\n"
+    "            \"relevance_score\": 0-10,\n"
+    "            \"key_concepts\": [\"concept1\", \"concept2\"],\n"
+    "            \"study_approach\": \"Detailed study approach\",\n"
+    "            \"practice_exercises\": [\"exercise1\", \"exercise2\"],\n"
+    "            \"common_pitfalls\": [\"pitfall1\", \"pitfall2\"],\n"
+    "            \"time_allocation\": \"Recommended study time\"\n"
+    "        }\n"
+    "    ],\n"
+    "    \"revision_strategy\": {\n"
+    "        \"priority_topics\": [\"topic1\", \"topic2\"],\n"
+    "        \"practice_focus\": \"Areas needing hands-on practice\",\n"
+    "        \"time_management\": \"Time allocation strategy\"\n"
+    "    },\n"
+    "    \"self_assessment\": [\n"
+    "        {\n"
+    "            \"question\": \"Practice question\",\n"
+    "            \"concept_tested\": \"Core concept being tested\",\n"
+    "            \"difficulty\": \"Easy/Medium/Hard\"\n"
+    "        }\n"
+    "    ]\n"
+    "}\n"
+)
+
+# Output format of the closing call that covers the whole exam rather than one module
+GENERAL_FORMAT = (
+    "{\n"
+    "    \"overall_preparation_tips\": [\n"
+    "        {\n"
+    "            \"category\": \"Time Management\",\n"
+    "            \"recommendations\": [\"tip1\", \"tip2\"]\n"
+    "        }\n"
+    "    ],\n"
+    "    \"exam_day_guidelines\": [\n"
+    "        {\n"
+    "            \"phase\": \"Before/During/After Exam\",\n"
+    "            \"tips\": [\"guideline1\", \"guideline2\"]\n"
+    "        }\n"
+    "    ]\n"
+    "}\n"
+)
 
 class ExamPrepAssistant:
-    def __init__(self):
+    def __init__(self, gateway: OllamaGateway = None, prompt_token_budget: int = 6000, module_token_budget: int = 2500):
         self.model = 'llama3.2'
-        self.client = AsyncClient()
+        # Whole-prompt budget; the materials list is compacted to whatever the rest leaves
+        self.prompt_token_budget = prompt_token_budget
+        # Materials budget of each prompt in per-module mode
+        self.module_token_budget = module_token_budget
+        # Requests go through a gateway (pooled client, concurrency limit, cache) shared with the other assistants
+        self.gateway = gateway or OllamaGateway()
 
-    async def generate_study_guide(self, course_materials: List[Dict], syllabus: Dict) -> Dict:
-        """Generate a comprehensive study guide based on course materials and syllabus."""
-        prompt = self._construct_prompt(course_materials, syllabus)
-        return await self._analyze_with_llm(prompt)
+    async def generate_study_guide(
+        self, course_materials: List[Dict], syllabus: Dict, use_cache: bool = True, per_module: bool = False
+    ) -> Dict:
+        """Generate a comprehensive study guide based on course materials and syllabus.
 
-    def _construct_prompt(self, course_materials: List[Dict], syllabus: Dict) -> str:
-        """Construct a detailed prompt for the LLM."""
+        With ``per_module`` every module is generated by its own concurrent
+        request, given only its most relevant materials, and a small closing
+        request writes the preparation tips and exam-day guidelines. Otherwise
+        the result carries the prompt compaction report as ``prompt_report``.
+        """
+        if per_module:
+            return await self._generate_per_module(course_materials, syllabus, use_cache)
+        prompt, report = self._construct_prompt(course_materials, syllabus)
+        study_guide = await self._analyze_with_llm(prompt, syllabus, use_cache)
+        study_guide["prompt_report"] = report
+        return study_guide
 
-        exam_details = (
-            f"EXAM DETAILS:\n"
-            f"Course: {syllabus.get('course_name', 'Computer Networks')}\n"
-            f"Exam Type: {syllabus.get('exam_type', 'Final Exam')}\n"
-            f"Date: {syllabus.get('exam_date', 'Upcoming')}\n"
-            f"Current Date: {syllabus.get('current_date', str(datetime.now().date()))}\n"
-            f"Duration: {syllabus.get('duration', '3 hours')}\n"
-            f"Format: {syllabus.get('format', 'Written + Practical')}\n"
+    async def _generate_per_module(self, course_materials: List[Dict], syllabus: Dict, use_cache: bool = True) -> Dict:
+        """Generate every module concurrently and assemble them into the study_guide schema."""
+        modules = syllabus.get('modules', {})
+        exam_details = self._format_exam_details(syllabus)
+
+        async def generate_module(name: str, details: Dict) -> Dict:
+            # Only materials that share terms with this module's objectives; all of them if none do
+            relevant = [m for score, m in rank_materials(course_materials, {name: details}) if score > 0]
+            materials_info, _ = build_materials_section(
+                relevant or course_materials, {name: details}, self.module_token_budget
+            )
+            prompt = (
+                "You are an experienced computer networks professor creating one module of an exam preparation guide.\n\n"
+                f"{exam_details}\n"
+                f"MODULE AND LEARNING OBJECTIVES:\n{self._format_modules({name: details})}\n"
+                f"AVAILABLE STUDY MATERIALS (most relevant first):\n{materials_info}\n\n"
+                f"REQUIRED OUTPUT FORMAT (for the module \"{name}\" only):\n{MODULE_FORMAT}"
+            )
+            module = await self.gateway.chat_json(
+                model=self.model, prompt=prompt, sections=MODULE_SECTIONS, use_cache=use_cache
+            )
+            module["name"] = name
+            return module
+
+        general_prompt = (
+            "You are an experienced computer networks professor writing the general part of an exam preparation guide.\n\n"
+            f"{exam_details}\n"
+            f"MODULES AND LEARNING OBJECTIVES:\n{self._format_modules(modules)}\n"
+            f"REQUIRED OUTPUT FORMAT:\n{GENERAL_FORMAT}"
         )
+        results = await asyncio.gather(
+            self.gateway.chat_json(
+                model=self.model,
+                prompt=general_prompt,
+                sections=("overall_preparation_tips", "exam_day_guidelines"),
+                use_cache=use_cache
+            ),
+            *[generate_module(name, details) for name, details in modules.items()],
+            return_exceptions=True
+        )
+
+        general, module_results = results[0], results[1:]
+        study_modules = []
+        for name, result in zip(modules, module_results):
+            if isinstance(result, Exception):
+                print(f"Error generating module '{name}': {result}")
+                study_modules.append({"name": name, "error": str(result)})
+            else:
+                study_modules.append(result)
+        if isinstance(general, Exception):
+            print(f"Error generating preparation tips: {general}")
+            general = {}
+
+        return {
+            "study_guide": {
+                "modules": study_modules,
+                "overall_preparation_tips": general.get("overall_preparation_tips", []),
+                "exam_day_guidelines": general.get("exam_day_guidelines", []),
+            }
+        }
+
+    async def stream_study_guide(
+        self, course_materials: List[Dict], syllabus: Dict, use_cache: bool = True
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Generate the study guide as a stream of events.
+
+        Yields ``{"event": "module", "index": i, "module": {...}}`` for each
+        entry of ``study_guide.modules`` as soon as its JSON object closes, then
+        ``{"event": "done", "study_guide": {...}, "prompt_report": {...}}`` with
+        the complete result, or ``{"event": "error", "error": "..."}``.
+        """
+        prompt, report = self._construct_prompt(course_materials, syllabus)
+        modules = JSONItemStream(("study_guide", "modules"))
+        try:
+            async for piece in self.gateway.chat_stream(
+                model=self.model,
+                messages=[{'role': 'user', 'content': prompt}],
+                format='json',
+                use_cache=use_cache
+            ):
+                # One feed can complete several modules (a cached response arrives in one piece)
+                first_index = modules.items_emitted
+                for offset, module in enumerate(modules.feed(piece)):
+                    yield {"event": "module", "index": first_index + offset, "module": module}
+        except Exception as e:
+            print(f"Error during LLM analysis: {e}")
+            yield {"event": "error", "error": str(e)}
+            return
+
+        try:
+            study_guide = json.loads(modules.text)
+        except json.JSONDecodeError as e:
+            study_guide = repair_json(modules.text)
+            if not isinstance(study_guide, dict):
+                print(f"Error parsing LLM response: {e}")
+                yield {"event": "error", "error": "Failed to generate valid study guide"}
+                return
+
+        try:
+            await self._complete_study_guide(prompt, study_guide, syllabus, use_cache)
+        except Exception as e:
+            print(f"Error completing study guide: {e}")
+        yield {"event": "done", "study_guide": study_guide, "prompt_report": report}
+
+    def _construct_prompt(self, course_materials: List[Dict], syllabus: Dict) -> Tuple[str, Dict[str, Any]]:
+        """Construct a detailed prompt for the LLM, with the report of how its materials were compacted."""
+
+        exam_details = self._format_exam_details(syllabus)
 
         modules_info = self._format_modules(syllabus.get('modules', {}))
-        materials_info = self._format_materials(course_materials)
 
         output_requirements = (
             "\nREQUIRED OUTPUT FORMAT:\n"
@@ -88,15 +257,42 @@ class ExamPrepAssistant:
             "...\n"
         )
 
+        def assemble(materials_info: str) -> str:
+            return (
+                "You are an experienced computer networks professor creating a comprehensive exam preparation guide.\n"
+                "Your task is to analyze the available course materials and create a structured study plan that will\n"
+                "maximize students' success in their final exam.\n\n"
+                f"{exam_details}\n"
+                f"MODULES AND LEARNING OBJECTIVES:\n{modules_info}\n\n"
+                f"AVAILABLE STUDY MATERIALS:\n{materials_info}\n\n"
+                f"{output_requirements}\n"
+                f"{additional_requirements}\n"
+            )
+
+        # Whatever the fixed parts leave of the budget goes to the materials (with a floor)
+        materials_budget = max(500, self.prompt_token_budget - estimate_tokens(assemble("")))
+        materials_info, report = build_materials_section(
+            course_materials, syllabus.get('modules', {}), materials_budget
+        )
+        if report["tokens_saved"]:
+            print(
+                f"Study guide prompt compacted: {report['tokens_full']} -> {report['tokens_used']} material tokens "
+                f"({report['tokens_saved']} saved; {report['materials_full']} full, "
+                f"{report['materials_summarized']} summarized, {report['materials_omitted']} omitted)",
+                flush=True
+            )
+        return assemble(materials_info), report
+
+    def _format_exam_details(self, syllabus: Dict) -> str:
+        """Format the exam details block of the prompt."""
         return (
-            "You are an experienced computer networks professor creating a comprehensive exam preparation guide.\n"
-            "Your task is to analyze the available course materials and create a structured study plan that will\n"
-            "maximize students' success in their final exam.\n\n"
-            f"{exam_details}\n"
-            f"MODULES AND LEARNING OBJECTIVES:\n{modules_info}\n\n"
-            f"AVAILABLE STUDY MATERIALS:\n{materials_info}\n\n"
-            f"{output_requirements}\n"
-            f"{additional_requirements}\n"
+            f"EXAM DETAILS:\n"
+            f"Course: {syllabus.get('course_name', 'Computer Networks')}\n"
+            f"Exam Type: {syllabus.get('exam_type', 'Final Exam')}\n"
+            f"Date: {syllabus.get('exam_date', 'Upcoming')}\n"
+            f"Current Date: {syllabus.get('current_date', str(datetime.now().date()))}\n"
+            f"Duration: {syllabus.get('duration', '3 hours')}\n"
+            f"Format: {syllabus.get('format', 'Written + Practical')}\n"
         )
 
     def _format_modules(self, modules: Dict) -> str:
@@ -107,30 +303,13 @@ class ExamPrepAssistant:
             formatted.append(f"- {module_name}:\n    Weight: {details.get('weight', '20%')}\n    Objectives:\n    {objectives}\n")
         return "\n".join(formatted)
 
-    def _format_materials(self, materials: List[Dict]) -> str:
-        """Format course materials information for the prompt."""
-        formatted = []
-        for material in materials:
-            topics = ', '.join(material.get('topics', []))
-            formatted.append(
-                f"- Filename: {material['filename']}\n"
-                f"  Type: {material['type']}\n"
-                f"  Description: {material['description']}\n"
-                f"  Date Added: {material['date_added']}\n"
-                f"  Topics Covered: {topics}\n"
-                # f"  Difficulty Level: {material.get('difficulty', 'Intermediate')}\n"
-            )
-        return "\n".join(formatted)
-
-    async def _analyze_with_llm(self, prompt: str) -> Dict:
+    async def _analyze_with_llm(self, prompt: str, syllabus: Dict, use_cache: bool = True) -> Dict:
         """Generate study guide using LLM asynchronously."""
         try:
-            response = await self.client.chat(
-                model=self.model,
-                messages=[{'role': 'user', 'content': prompt}],
-                format='json'
-            )
-            return json.loads(response['message']['content'])
+            # Missing sections and modules are requested together in _complete_study_guide
+            study_guide = await self.gateway.chat_json(model=self.model, prompt=prompt, use_cache=use_cache)
+            await self._complete_study_guide(prompt, study_guide, syllabus, use_cache)
+            return study_guide
         except json.JSONDecodeError as e:
             print(f"Error parsing LLM response: {e}")
             return {"error": "Failed to generate valid study guide"}
@@ -138,6 +317,26 @@ class ExamPrepAssistant:
             print(f"Error during LLM analysis: {e}")
             return {"error": str(e)}
 
+    async def _complete_study_guide(self, prompt: str, study_guide: Dict, syllabus: Dict, use_cache: bool = True):
+        """Request missing sections and syllabus modules of a partial study guide in a follow-up turn."""
+        messages = [{'role': 'user', 'content': prompt}]
+        missing = missing_sections(study_guide, ("study_guide",), STUDY_GUIDE_SECTIONS)
+
+        present = {
+            str(module.get("name", "")).lower()
+            for module in study_guide["study_guide"].get("modules", []) if isinstance(module, dict)
+        }
+        missing_modules = [name for name in syllabus.get('modules', {}) if name.lower() not in present]
+        if missing_modules and "modules" not in missing:
+            missing.append("modules")
+
+        if missing:
+            instructions = f"Only include these modules: {', '.join(missing_modules)}." if missing_modules else ""
+            await self.gateway.complete_json(
+                self.model, messages, study_guide, ("study_guide",), missing,
+                instructions=instructions, use_cache=use_cache
+            )
+
 # Example usage
 async def main():
     # Sample course materials
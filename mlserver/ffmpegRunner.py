@@ -0,0 +1,57 @@
+import asyncio
+from typing import Optional, Tuple
+
+import ffmpeg
+
+
+async def _terminate(process: asyncio.subprocess.Process, grace_period: float = 5.0):
+    """Stop an ffmpeg process, escalating to SIGKILL if it ignores SIGTERM."""
+    if process.returncode is not None:
+        return
+    process.terminate()
+    try:
+        await asyncio.wait_for(process.wait(), grace_period)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+async def run_ffmpeg(
+    stream,
+    timeout: Optional[float] = None,
+    capture_stdout: bool = False
+) -> Tuple[bytes, bytes]:
+    """Run an ffmpeg-python stream as an asyncio subprocess.
+
+    The event loop stays free while ffmpeg runs. stderr is always captured,
+    the process is killed on timeout or cancellation, and a non-zero exit
+    raises ``ffmpeg.Error`` just like ``ffmpeg.run``.
+    """
+    args = ffmpeg.compile(stream, overwrite_output=True)
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE if capture_stdout else asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        await _terminate(process)
+        raise TimeoutError(f"ffmpeg did not finish within {timeout} seconds")
+    except asyncio.CancelledError:
+        await _terminate(process)
+        raise
+
+    if process.returncode != 0:
+        raise ffmpeg.Error('ffmpeg', stdout, stderr)
+    return stdout or b'', stderr or b''
+
+
+def describe_error(error: ffmpeg.Error, max_lines: int = 3) -> str:
+    """Return the last few lines of ffmpeg's stderr for log messages."""
+    stderr = (error.stderr or b'').decode('utf-8', errors='replace').strip()
+    if not stderr:
+        return str(error)
+    return " | ".join(stderr.splitlines()[-max_lines:])
@@ -0,0 +1,125 @@
+import asyncio
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import ffmpeg
+import numpy as np
+
+from ffmpegRunner import run_ffmpeg, describe_error
+
+# dHash compares each pixel of a 9x8 thumbnail with its right neighbour: 64 bits
+HASH_WIDTH = 9
+HASH_HEIGHT = 8
+
+
+def dhash(gray: np.ndarray) -> int:
+    """Difference hash of a ``(8, 9)`` grayscale thumbnail as a 64-bit integer."""
+    bits = (gray[:, 1:] > gray[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distances(hashes: np.ndarray, value: int) -> np.ndarray:
+    """Number of differing bits between every hash in ``hashes`` (uint64) and ``value``."""
+    diff = (hashes ^ np.uint64(value)).view(np.uint8).reshape(len(hashes), 8)
+    return np.unpackbits(diff, axis=1).sum(axis=1)
+
+
+def group_duplicates(hashes: List[Optional[int]], threshold: int) -> List[int]:
+    """Map every frame to the first earlier frame within ``threshold`` bits, or to itself.
+
+    Frames are compared with every kept image rather than only their
+    neighbour, so a slide shown again later also collapses. Frames
+    without a hash are always kept.
+    """
+    kept: List[int] = []
+    kept_hashes = np.zeros(len(hashes), dtype=np.uint64)
+    groups = []
+    for index, value in enumerate(hashes):
+        if value is not None and kept:
+            distances = hamming_distances(kept_hashes[:len(kept)], value)
+            closest = int(np.argmin(distances))
+            if distances[closest] <= threshold:
+                groups.append(kept[closest])
+                continue
+        groups.append(index)
+        if value is not None:
+            kept_hashes[len(kept)] = value
+            kept.append(index)
+    return groups
+
+
+async def image_hash(path: Path, timeout: Optional[float] = None) -> int:
+    """Decode an image to a 9x8 grayscale thumbnail with ffmpeg and return its dHash."""
+    stream = (
+        ffmpeg
+        .input(str(path))
+        .filter('scale', HASH_WIDTH, HASH_HEIGHT, flags='area')
+        .output('pipe:', format='rawvideo', pix_fmt='gray', vframes=1)
+    )
+    out, _ = await run_ffmpeg(stream, timeout=timeout, capture_stdout=True)
+    pixels = np.frombuffer(out, np.uint8)[:HASH_WIDTH * HASH_HEIGHT]
+    return dhash(pixels.reshape(HASH_HEIGHT, HASH_WIDTH).astype(np.int16))
+
+
+async def dedupe_frames(
+    keyframes_dir: Path,
+    frames: List[Dict[str, Any]],
+    threshold: int,
+    concurrency: int = 4,
+    timeout: Optional[float] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Collapse near-duplicate keyframes into one stored image.
+
+    ``frames`` are manifest entries in timestamp order. A frame whose dHash
+    is within ``threshold`` bits of an earlier one is deleted from disk;
+    its entry keeps its index, timestamp and description but points at
+    the earlier image (``file`` and ``duplicate_of``), and the kept entry
+    lists every timestamp it stands for under ``timestamps``. Returns the
+    updated entries and a report with the bytes saved.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def hash_frame(frame: Dict[str, Any]) -> Optional[int]:
+        async with semaphore:
+            try:
+                return await image_hash(keyframes_dir / frame["file"], timeout=timeout)
+            except (ffmpeg.Error, TimeoutError) as e:
+                message = describe_error(e) if isinstance(e, ffmpeg.Error) else str(e)
+                print(f"Warning: Failed to hash keyframe {frame['file']}: {message}")
+                return None
+
+    hashes = await asyncio.gather(*[hash_frame(frame) for frame in frames])
+    groups = group_duplicates(hashes, threshold)
+
+    bytes_saved = 0
+    removed = 0
+    for frame, value in zip(frames, hashes):
+        frame["dhash"] = f"{value:016x}" if value is not None else None
+    for frame in frames:
+        frame["timestamps"] = [frame["timestamp"]]
+    for position, representative in enumerate(groups):
+        if representative == position:
+            continue
+        frame, kept = frames[position], frames[representative]
+        try:
+            (keyframes_dir / frame["file"]).unlink()
+        except OSError as e:
+            print(f"Warning: Failed to remove duplicate keyframe {frame['file']}: {str(e)}")
+            continue
+        bytes_saved += frame["bytes"]
+        removed += 1
+        kept["timestamps"].append(frame["timestamp"])
+        frame.update(
+            file=kept["file"], width=kept["width"], height=kept["height"],
+            bytes=0, duplicate_of=kept["index"]
+        )
+        del frame["timestamps"]
+
+    report = {
+        "threshold": threshold,
+        "frames": len(frames),
+        "images_stored": len(frames) - removed,
+        "duplicates_removed": removed,
+        "bytes_saved": bytes_saved,
+    }
+    return frames, report
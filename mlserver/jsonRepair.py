@@ -0,0 +1,115 @@
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Each attempt re-parses the text, so stop after this many candidate cut points
+MAX_REPAIR_ATTEMPTS = 200
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """Parse LLM output that may be truncated or wrapped in prose.
+
+    Leading text before the first ``{``/``[`` and anything after the
+    top-level value are ignored. For a truncated document the text is cut
+    back to the last point where a value was complete (after a closed
+    container or before a comma) and the open containers are closed, so
+    every field that was fully generated survives. Returns None when nothing
+    can be salvaged.
+    """
+    starts = [i for i in (text.find('{'), text.find('[')) if i >= 0]
+    if not starts:
+        return None
+    text = text[min(starts):]
+
+    stack: List[str] = []
+    cuts: List[Tuple[int, str]] = []
+    in_string = False
+    escape = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+            cuts.append((i + 1, "".join(reversed(stack))))
+        elif ch in '}]':
+            if not stack:
+                break
+            stack.pop()
+            if not stack:
+                try:
+                    return json.loads(text[:i + 1])
+                except json.JSONDecodeError:
+                    break
+            cuts.append((i + 1, "".join(reversed(stack))))
+        elif ch == ',' and stack:
+            cuts.append((i, "".join(reversed(stack))))
+
+    for pos, closers in reversed(cuts[-MAX_REPAIR_ATTEMPTS:]):
+        try:
+            return _drop_empty_items(json.loads(text[:pos] + closers))
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def _drop_empty_items(value: Any) -> Any:
+    """Remove the empty objects a cut right after ``{`` leaves behind in arrays."""
+    if isinstance(value, dict):
+        return {key: _drop_empty_items(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_drop_empty_items(item) for item in value if item != {}]
+    return value
+
+
+def section_node(data: Dict[str, Any], root: Iterable[str]) -> Dict[str, Any]:
+    """Return the object at ``root`` inside ``data``, creating missing levels."""
+    node = data
+    for key in root:
+        if not isinstance(node.get(key), dict):
+            node[key] = {}
+        node = node[key]
+    return node
+
+
+def missing_sections(
+    data: Dict[str, Any], root: Iterable[str], sections: Iterable[str], allow_empty: bool = False
+) -> List[str]:
+    """List the ``sections`` under ``root`` that are absent (or empty, unless ``allow_empty``)."""
+    node = section_node(data, root)
+    if allow_empty:
+        return [section for section in sections if node.get(section) is None]
+    return [section for section in sections if not node.get(section)]
+
+
+def merge_sections(data: Dict[str, Any], root: Iterable[str], reply: Any, sections: Iterable[str]) -> List[str]:
+    """Copy ``sections`` from a follow-up ``reply`` into ``data``; lists are appended to.
+
+    The reply may repeat the ``root`` wrapper or contain the sections
+    directly. Returns the sections that were filled.
+    """
+    if not isinstance(reply, dict):
+        return []
+    root = list(root)
+    source = reply
+    for key in root:
+        if isinstance(source.get(key), dict):
+            source = source[key]
+
+    node = section_node(data, root)
+    filled = []
+    for section in sections:
+        value = source.get(section)
+        if not value:
+            continue
+        if isinstance(node.get(section), list) and isinstance(value, list):
+            node[section].extend(value)
+        else:
+            node[section] = value
+        filled.append(section)
+    return filled
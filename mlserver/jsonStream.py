@@ -0,0 +1,75 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+
+class _Frame:
+    def __init__(self, kind: str, path: Tuple, start: int):
+        self.kind = kind  # '{' or '['
+        self.path = path
+        self.start = start
+        self.key: Optional[str] = None
+        self.index = 0
+
+
+class JSONItemStream:
+    """Incrementally scan streamed JSON text and emit the items of one array as they close.
+
+    ``path`` names the array by its object keys, e.g. ``("study_guide", "modules")``.
+    Text is fed in arbitrary pieces; ``feed`` returns every element of that
+    array that was completed by the new text, already parsed.
+    """
+
+    def __init__(self, path: Tuple[str, ...]):
+        self.path = tuple(path)
+        self.text = ""
+        self.items_emitted = 0
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+
+    def feed(self, chunk: str) -> List[Any]:
+        self.text += chunk
+        items = []
+        text = self.text
+        while self._pos < len(text):
+            ch = text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    try:
+                        self._last_string = json.loads(text[self._string_start:self._pos + 1])
+                    except json.JSONDecodeError:
+                        self._last_string = None
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif ch == ':' and self._stack and self._stack[-1].kind == '{':
+                self._stack[-1].key = self._last_string
+            elif ch == ',' and self._stack and self._stack[-1].kind == '[':
+                self._stack[-1].index += 1
+            elif ch in '{[':
+                self._stack.append(_Frame(ch, self._child_path(), self._pos))
+            elif ch in '}]' and self._stack:
+                frame = self._stack.pop()
+                parent = self._stack[-1] if self._stack else None
+                if parent is not None and parent.kind == '[' and parent.path == self.path:
+                    try:
+                        items.append(json.loads(text[frame.start:self._pos + 1]))
+                        self.items_emitted += 1
+                    except json.JSONDecodeError:
+                        pass
+            self._pos += 1
+        return items
+
+    def _child_path(self) -> Tuple:
+        if not self._stack:
+            return ()
+        parent = self._stack[-1]
+        return parent.path + ((parent.key,) if parent.kind == '{' else (parent.index,))
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import re
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import ffmpeg
+
+from ffmpegRunner import run_ffmpeg
+
+MANIFEST_NAME = "manifest.json"
+
+# Only these widths are generated so the variant cache stays bounded
+THUMBNAIL_WIDTHS = (160, 320, 640)
+VARIANT_FORMATS = ("jpg", "webp")
+
+# SOF0-SOF15 carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) share the range but do not
+_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_dimensions(path: Path) -> Optional[Tuple[int, int]]:
+    """Read ``(width, height)`` from a JPEG's start-of-frame header without decoding it."""
+    try:
+        with open(path, 'rb') as f:
+            if f.read(2) != b'\xff\xd8':
+                return None
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None
+                # Standalone markers without a length field
+                if marker[1] in (0x01, *range(0xD0, 0xD8)):
+                    continue
+                length_bytes = f.read(2)
+                if len(length_bytes) < 2:
+                    return None
+                length = int.from_bytes(length_bytes, 'big')
+                if marker[1] in _SOF_MARKERS:
+                    header = f.read(5)
+                    if len(header) < 5:
+                        return None
+                    return int.from_bytes(header[3:5], 'big'), int.from_bytes(header[1:3], 'big')
+                f.seek(length - 2, 1)
+    except OSError:
+        return None
+
+
+def manifest_entry(
+    index: int,
+    timestamp: str,
+    description: str,
+    path: Path,
+    extract_ms: Optional[float] = None
+) -> Dict[str, Any]:
+    """Describe one extracted keyframe for the manifest."""
+    dimensions = jpeg_dimensions(path)
+    return {
+        "index": index,
+        "timestamp": timestamp,
+        "description": description,
+        "file": path.name,
+        "width": dimensions[0] if dimensions else None,
+        "height": dimensions[1] if dimensions else None,
+        "bytes": path.stat().st_size,
+        "extract_ms": round(extract_ms, 1) if extract_ms is not None else None,
+    }
+
+
+def write_manifest(keyframes_dir: Path, frames: List[Dict[str, Any]], **extra) -> Path:
+    """Write ``manifest.json`` for a keyframes directory, frames sorted by index."""
+    manifest = {
+        "created_at": time.time(),
+        "frames": sorted(frames, key=lambda frame: frame["index"]),
+        **extra,
+    }
+    manifest_path = keyframes_dir / MANIFEST_NAME
+    tmp_path = manifest_path.with_suffix(".json.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    tmp_path.replace(manifest_path)
+    return manifest_path
+
+
+class KeyframeIndex:
+    """Serve keyframes through their manifests, with on-demand resized/WebP variants.
+
+    Manifests are kept in memory (the ``max_manifests`` most recently used)
+    and reloaded only when the file changes on disk. Directories extracted
+    before manifests existed get one built from their sorted file names.
+    Variants are generated once with ffmpeg into a ``variants`` subdirectory.
+    """
+
+    def __init__(self, max_manifests: int = 256, ffmpeg_timeout: float = 60):
+        self.max_manifests = max_manifests
+        self.ffmpeg_timeout = ffmpeg_timeout
+        self._manifests: "OrderedDict[Path, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._pending: Dict[Path, asyncio.Task] = {}
+
+    def manifest(self, keyframes_dir: Path) -> Dict[str, Any]:
+        keyframes_dir = Path(keyframes_dir)
+        manifest_path = keyframes_dir / MANIFEST_NAME
+        if not manifest_path.exists():
+            if not keyframes_dir.is_dir():
+                raise FileNotFoundError(f"Keyframes directory not found: {keyframes_dir}")
+            self._build_legacy_manifest(keyframes_dir)
+
+        mtime = manifest_path.stat().st_mtime
+        cached = self._manifests.get(keyframes_dir)
+        if cached is not None and cached[0] == mtime:
+            self._manifests.move_to_end(keyframes_dir)
+            return cached[1]
+
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self._manifests[keyframes_dir] = (mtime, manifest)
+        self._manifests.move_to_end(keyframes_dir)
+        while len(self._manifests) > self.max_manifests:
+            self._manifests.popitem(last=False)
+        return manifest
+
+    def frame_path(self, keyframes_dir: Path, frame_number: int) -> Path:
+        """Return the image of frame ``frame_number`` (position in the manifest)."""
+        frames = self.manifest(keyframes_dir)["frames"]
+        if frame_number < 0 or frame_number >= len(frames):
+            raise IndexError(f"Keyframe {frame_number} not found")
+        return Path(keyframes_dir) / frames[frame_number]["file"]
+
+    async def variant(
+        self, keyframes_dir: Path, frame_number: int, width: Optional[int] = None, format: str = "jpg"
+    ) -> Path:
+        """Return a cached ``width``-wide ``format`` version of a frame, generating it on first use."""
+        if width is not None and width not in THUMBNAIL_WIDTHS:
+            raise ValueError(f"Unsupported width {width}. Available: {', '.join(map(str, THUMBNAIL_WIDTHS))}")
+        if format not in VARIANT_FORMATS:
+            raise ValueError(f"Unsupported format '{format}'. Available: {', '.join(VARIANT_FORMATS)}")
+
+        source = self.frame_path(keyframes_dir, frame_number)
+        if width is None and format == "jpg":
+            return source
+
+        target = Path(keyframes_dir) / "variants" / f"{source.stem}_{width or 'full'}.{format}"
+        if target.exists():
+            return target
+
+        # Concurrent requests for the same variant share one ffmpeg run
+        task = self._pending.get(target)
+        if task is None:
+            task = asyncio.create_task(self._render(source, target, width, format))
+            self._pending[target] = task
+            task.add_done_callback(lambda _: self._pending.pop(target, None))
+        await asyncio.shield(task)
+        return target
+
+    async def _render(self, source: Path, target: Path, width: Optional[int], format: str):
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f".{target.stem}.tmp.{format}")
+        stream = ffmpeg.input(str(source))
+        if width is not None:
+            stream = stream.filter('scale', width, -2)
+        if format == "webp":
+            output = ffmpeg.output(stream, str(tmp_path), vcodec='libwebp', quality=75, vframes=1)
+        else:
+            output = ffmpeg.output(stream, str(tmp_path), vframes=1, **{'q:v': 5})
+        await run_ffmpeg(output, timeout=self.ffmpeg_timeout)
+        tmp_path.replace(target)
+
+    @staticmethod
+    def _build_legacy_manifest(keyframes_dir: Path) -> None:
+        frames = []
+        for index, path in enumerate(sorted(keyframes_dir.glob("frame_*.jpg"))):
+            # frame_{idx:03d}_{timestamp}_{description}.jpg
+            match = re.match(r"frame_\d+_([^_]*)_?(.*)$", path.stem)
+            timestamp, description = match.groups() if match else ("", "")
+            frames.append(manifest_entry(index, timestamp, description, path))
+        write_manifest(keyframes_dir, frames)
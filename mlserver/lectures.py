@@ -3,18 +3,74 @@ import json
 import asyncio
 from pathlib import Path
 import subprocess
-import whisper
-from ollama import AsyncClient
-from typing import Dict, Tuple, Any
-import torch
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Any
 import sys
 import tqdm
 import time
 import ffmpeg
+import numpy as np
+from workers import SharedAudio, WhisperPool
+from batching import WhisperBatcher
+from modelRegistry import AVAILABLE_MODELS, WhisperModelRegistry
+from mediaCache import ArtifactCache
+from ollamaGateway import OllamaGateway
+from promptBudget import estimate_tokens
+from ffmpegRunner import run_ffmpeg, describe_error
+from keyframeIndex import MANIFEST_NAME, manifest_entry, write_manifest
+from slideDetector import detect_slides, normalize_timestamp
+from frameDedup import dedupe_frames
+from segmentStore import parse_transcript, segments_path, write_segments
+from searchIndex import SearchIndex
+from chunking import SAMPLE_RATE, SegmentStitcher, split_audio
+
+# Keys requested from the LLM for a full analysis, one transcript window, and the merge step
+ANALYSIS_SECTIONS = ("title", "summary", "key_points", "topics", "key_moments")
+WINDOW_SECTIONS = ("summary", "key_points", "topics", "key_moments")
+REDUCE_SECTIONS = ("title", "summary", "key_points", "topics")
+
+# Where process_media takes keyframe timestamps from: the LLM analysis, slide changes, or
+# the analysis with slide changes as the fallback
+KEYFRAME_MODES = ("llm", "scenes", "auto")
+
+# In-memory audio: float32 samples, or int16 samples shared with the Whisper pool processes
+AudioSamples = np.ndarray | SharedAudio
+
+# Receives each batch of finished segments while a transcription is running
+SegmentCallback = Callable[[List[Dict[str, Any]]], Awaitable[None]]
 
 class MediaProcessor:
-    def __init__(self, base_dir: str = "media_processing"):
-        """Initialize the MediaProcessor with necessary directories."""
+    def __init__(
+        self,
+        base_dir: str = "media_processing",
+        whisper_pool: WhisperPool = None,
+        whisper_batcher: WhisperBatcher = None,
+        whisper_model: str = "base",
+        whisper_memory_mb: int = 4096,
+        in_memory_audio: bool = True,
+        ffmpeg_timeout: float = 30 * 60,
+        keyframe_batch_size: int = 8,
+        keyframe_parallel_passes: int = 2,
+        chunk_seconds: float = 300,
+        stream_first_chunk_seconds: float = 30,
+        analysis_token_budget: int = 6000,
+        analysis_window_tokens: int = 3000,
+        analysis_concurrency: int = 4,
+        llm_gateway: OllamaGateway = None,
+        keyframe_mode: str = "auto",
+        slide_detection_fps: float = 1.0,
+        slide_change_threshold: float = 0.08,
+        keyframe_dedup_threshold: Optional[int] = 6,
+        search_index: SearchIndex = None
+    ):
+        """Initialize the MediaProcessor with necessary directories.
+
+        Without a ``whisper_pool`` Whisper models are loaded into this process.
+        ``keyframe_mode`` is one of ``KEYFRAME_MODES``; a ``keyframe_dedup_threshold``
+        of None keeps near-duplicate keyframes.
+        """
+        if keyframe_mode not in KEYFRAME_MODES:
+            raise ValueError(f"Unknown keyframe mode '{keyframe_mode}'. Available: {', '.join(KEYFRAME_MODES)}")
+
         self.base_dir = Path(base_dir)
         self.temp_dir = self.base_dir / "temp"
         self.transcription_dir = self.base_dir / "transcriptions"
@@ -25,14 +81,33 @@ class MediaProcessor:
         for dir_path in [self.temp_dir, self.transcription_dir, self.keyframes_dir]:
             dir_path.mkdir(parents=True, exist_ok=True)
         
-        # Initialize Whisper model with GPU support
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"Loading Whisper model on {self.device}...", end='', flush=True)
-        self.whisper_model = whisper.load_model("base").to(self.device)
-        print(" Done!")
+        # Whisper models are loaded lazily, either in the pool workers or in this process
+        self.whisper_pool = whisper_pool
+        self.whisper_batcher = whisper_batcher
+        self.default_whisper_model = whisper_pool.model_name if whisper_pool else whisper_model
+        self.whisper_models = None if whisper_pool else WhisperModelRegistry(memory_budget_mb=whisper_memory_mb)
+        self.language = "en"
+        self.in_memory_audio = in_memory_audio
+        self.ffmpeg_timeout = ffmpeg_timeout
+        self.keyframe_batch_size = keyframe_batch_size
+        self.keyframe_parallel_passes = keyframe_parallel_passes
+        self.chunk_seconds = chunk_seconds
+        self.stream_first_chunk_seconds = stream_first_chunk_seconds
+        self.keyframe_mode = keyframe_mode
+        self.slide_detection_fps = slide_detection_fps
+        self.slide_change_threshold = slide_change_threshold
+        self.keyframe_dedup_threshold = keyframe_dedup_threshold
+        self.search_index = search_index
         
-        # Initialize Ollama AsyncClient
-        self.client = AsyncClient()
+        # Ollama requests go through the shared gateway
+        self.llm_model = 'llama3.2'
+        self.analysis_token_budget = analysis_token_budget
+        self.analysis_window_tokens = analysis_window_tokens
+        self.analysis_concurrency = analysis_concurrency
+        self.llm_gateway = llm_gateway or OllamaGateway()
+
+        # Derived artifacts are cached by media hash and pipeline parameters
+        self.cache = ArtifactCache(self.base_dir)
 
     @staticmethod
     def print_with_flush(text: str):
@@ -42,18 +117,17 @@ class MediaProcessor:
 
     async def extract_audio(self, mp4_path: str | Path) -> Path:
         """Extract audio from MP4 and convert to WAV format."""
-        # rel_path = mp4_path
-        self.mp4_path = Path(mp4_path)
-        if not self.mp4_path.exists():
+        mp4_path = Path(mp4_path)
+        if not mp4_path.exists():
             raise FileNotFoundError(f"Video file not found: {mp4_path}")
             
-        wav_path = self.temp_dir / f"{self.mp4_path.stem}.wav"
+        wav_path = self.temp_dir / f"{mp4_path.stem}.wav"
         
         self.print_with_flush("Extracting audio...")
 
-        (
+        stream = (
             ffmpeg
-            .input(str(self.mp4_path))        # Input video file
+            .input(str(mp4_path))        # Input video file
             .output(str(wav_path), 
                     **{
                         'b:a': '64k',     # Set audio bitrate to 64K
@@ -62,35 +136,94 @@ class MediaProcessor:
                         'vn': None,       # Ignore video stream
                         'filter:a': 'volume=2.0'  # Increase volume by a factor of 2.0
                     })
-            .run()
         )
+        try:
+            await run_ffmpeg(stream, timeout=self.ffmpeg_timeout)
+        except ffmpeg.Error as e:
+            raise RuntimeError(f"Audio extraction failed: {describe_error(e)}")
 
         self.print_with_flush(" Done!\n")
         return wav_path
 
+    async def extract_pcm(self, mp4_path: str | Path) -> AudioSamples:
+        """Decode the audio track to 16 kHz mono samples without touching disk.
 
-    async def transcribe_audio(self, wav_path: Path) -> Tuple[Path, Dict[str, Any]]:
-        """Transcribe WAV file using Whisper with progress tracking."""
-        if not wav_path.exists():
-            raise FileNotFoundError(f"WAV file not found: {wav_path}")
+        With a Whisper pool the samples stay 16-bit in shared memory, which
+        the workers read directly; the caller must ``close`` them.
+        """
+        mp4_path = Path(mp4_path)
+        if not mp4_path.exists():
+            raise FileNotFoundError(f"Video file not found: {mp4_path}")
+
+        self.print_with_flush("Extracting audio...")
+
+        stream = (
+            ffmpeg
+            .input(str(mp4_path))
+            .output('pipe:',
+                    **{
+                        'format': 's16le',        # Raw little-endian 16-bit PCM
+                        'acodec': 'pcm_s16le',
+                        'ar': 16000,              # Whisper's expected sample rate
+                        'ac': 1,
+                        'vn': None,
+                        'filter:a': 'volume=2.0'
+                    })
+        )
+        try:
+            out, _ = await run_ffmpeg(stream, timeout=self.ffmpeg_timeout, capture_stdout=True)
+        except ffmpeg.Error as e:
+            raise RuntimeError(f"Audio extraction failed: {describe_error(e)}")
+
+        self.print_with_flush(" Done!\n")
+        if self.whisper_pool is not None:
+            return SharedAudio.from_bytes(out)
+        return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+    async def transcribe_audio(
+        self,
+        audio: Path | AudioSamples,
+        name: str = None,
+        on_segments: Optional[SegmentCallback] = None,
+        model_name: Optional[str] = None,
+        stream: bool = False
+    ) -> Tuple[Path, Dict[str, Any]]:
+        """Transcribe a WAV file or in-memory samples using Whisper with progress tracking.
+
+        ``on_segments`` receives segments in order as they are decoded. With
+        ``stream`` the audio is cut into short leading chunks so text arrives early.
+        """
+        if isinstance(audio, AudioSamples):
+            if name is None:
+                raise ValueError("A name is required when transcribing in-memory audio")
+        elif not audio.exists():
+            raise FileNotFoundError(f"WAV file not found: {audio}")
+        else:
+            name = name or audio.stem
+
+        model_name = model_name or self.default_whisper_model
+        if model_name not in AVAILABLE_MODELS:
+            raise ValueError(f"Unknown Whisper model '{model_name}'")
         
-        transcript_path = self.transcription_dir / f"{wav_path.stem}_transcript.txt"
+        transcript_path = self.transcription_dir / f"{name}_transcript.txt"
         
         try:
             self.print_with_flush("Starting transcription...\n")
             
             # Create progress bar for initial processing
             with tqdm.tqdm(total=100, desc="Processing audio") as pbar:
-                result = await asyncio.to_thread(
-                    self.whisper_model.transcribe,
-                    str(wav_path),
-                    language="en",
-                    fp16=self.device == "cuda",
-                    verbose=False
-                )
+                streamed = False
+                streaming = stream and on_segments is not None
+                if self._should_chunk(audio, streaming=streaming):
+                    result = await self._transcribe_chunked(audio, model_name, on_segments, streaming)
+                    streamed = True
+                else:
+                    result = await self._run_whisper(audio, model_name)
                 pbar.update(100)
             
             segments = result["segments"]
+            if on_segments is not None and not streamed and segments:
+                await on_segments(segments)
             
             # Write segments with progress tracking
             async with asyncio.Lock():
@@ -108,9 +241,14 @@ class MediaProcessor:
                             text = f"{timestamp} {segment['text'].strip()}"
                             f.write(text + '\n')
                             self.print_with_flush(f"\r{text}\n")
-                            
-                            # Small delay for readable output
-                            await asyncio.sleep(0.1)
+                write_segments(segments_path(transcript_path), segments)
+
+            if self.search_index is not None:
+                # A failed index update should not lose the transcript; the lecture is picked up again on restart
+                try:
+                    await asyncio.to_thread(self.search_index.add_lecture, name, segments)
+                except Exception as e:
+                    print(f"Warning: Failed to index transcript {name}: {str(e)}")
             
             self.print_with_flush("\nTranscription completed!\n")
             return transcript_path, result
@@ -118,6 +256,81 @@ class MediaProcessor:
         except Exception as e:
             raise RuntimeError(f"Transcription failed: {str(e)}")
         
+    async def _run_whisper(self, audio: Path | AudioSamples, model_name: str) -> Dict[str, Any]:
+        """Transcribe on the worker pool when there is one, otherwise in a thread of this process."""
+        if self.whisper_batcher is not None and isinstance(audio, AudioSamples):
+            return await self.whisper_batcher.transcribe(audio, model_name, self.language)
+
+        if self.whisper_pool is not None:
+            return await self.whisper_pool.transcribe(
+                audio,
+                model_name=model_name,
+                language=self.language,
+                verbose=False
+            )
+
+        model = await asyncio.to_thread(self.whisper_models.get, model_name)
+        return await asyncio.to_thread(
+            model.transcribe,
+            str(audio) if isinstance(audio, Path) else audio,
+            language=self.language,
+            fp16=self.whisper_models.device == "cuda",
+            verbose=False
+        )
+
+    def _should_chunk(self, audio: Path | AudioSamples, streaming: bool = False) -> bool:
+        """Decide whether to transcribe ``audio`` in chunks.
+
+        Streaming chunks anything longer than the first chunk so text arrives
+        early; otherwise chunking only pays off for long audio spread over
+        more than one worker.
+        """
+        if not self.chunk_seconds or not isinstance(audio, AudioSamples):
+            return False
+        if streaming:
+            return len(audio) > self.stream_first_chunk_seconds * SAMPLE_RATE
+        return (
+            self.whisper_pool is not None
+            and self.whisper_pool.num_workers > 1
+            and len(audio) > 2 * self.chunk_seconds * SAMPLE_RATE
+        )
+
+    async def _transcribe_chunked(
+        self,
+        audio: AudioSamples,
+        model_name: str,
+        on_segments: Optional[SegmentCallback] = None,
+        streaming: bool = False
+    ) -> Dict[str, Any]:
+        """Split audio at pauses, transcribe the chunks and stitch them back in order."""
+        first_chunk_seconds = self.stream_first_chunk_seconds if streaming else None
+        chunks = split_audio(audio, self.chunk_seconds, first_chunk_seconds=first_chunk_seconds)
+        self.print_with_flush(f"Transcribing {len(chunks)} chunks...\n")
+
+        if self.whisper_pool is not None:
+            # All chunks are queued on the pool at once; results are consumed in order
+            pending = [
+                asyncio.ensure_future(self._run_whisper(samples, model_name))
+                for _, samples in chunks
+            ]
+        else:
+            pending = None
+
+        stitcher = SegmentStitcher()
+        try:
+            for index, (offset, samples) in enumerate(chunks):
+                if pending is not None:
+                    result = await pending[index]
+                else:
+                    result = await self._run_whisper(samples, model_name)
+                added = stitcher.add(offset, result)
+                if on_segments is not None and added:
+                    await on_segments(added)
+        finally:
+            for future in pending or []:
+                future.cancel()
+        return stitcher.result()
+        
     async def save_analysis(self, analysis: Dict[str, Any], base_name: str) -> Path:
         """Save analysis results to a JSON file."""
         self.analysis_dir.mkdir(exist_ok=True)
@@ -128,8 +341,39 @@ class MediaProcessor:
                 json.dump(analysis, f, indent=4)
         return analysis_path
         
-    async def analyze_transcript(self, transcript_path: Path) -> Dict[str, Any]:
-        """Analyze transcript using Ollama AsyncClient."""
+    def _split_transcript(self, transcript_text: str) -> List[str]:
+        """Split a transcript into windows of whole segment lines within the window token budget."""
+        windows, current, current_tokens = [], [], 0
+        for line in transcript_text.splitlines():
+            line_tokens = estimate_tokens(line)
+            if current and current_tokens + line_tokens > self.analysis_window_tokens:
+                windows.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(line)
+            current_tokens += line_tokens
+        if current:
+            windows.append("\n".join(current))
+        return windows
+
+    async def _chat_json(self, prompt: str, sections: Tuple[str, ...], use_cache: bool = True) -> Dict[str, Any]:
+        """Send a JSON-format prompt, repairing partial output and falling back to the raw text as the summary."""
+        try:
+            return await self.llm_gateway.chat_json(
+                model=self.llm_model,
+                prompt=prompt,
+                sections=sections,
+                use_cache=use_cache
+            )
+        except json.JSONDecodeError as e:
+            return {
+                "summary": e.doc,
+                "key_points": [],
+                "topics": [],
+                "key_moments": []
+            }
+
+    async def analyze_transcript(self, transcript_path: Path, use_cache: bool = True) -> Dict[str, Any]:
+        """Analyze transcript using Ollama, map-reduce style over windows when it exceeds the token budget."""
         if not transcript_path.exists():
             raise FileNotFoundError(f"Transcript file not found: {transcript_path}")
             
@@ -139,7 +383,10 @@ class MediaProcessor:
                 with open(transcript_path, 'r', encoding='utf-8') as f:
                     transcript_text = f.read()
 
-            prompt = f"""
+            if estimate_tokens(transcript_text) > self.analysis_token_budget:
+                analysis_data = await self._map_reduce_analysis(transcript_text, use_cache)
+            else:
+                prompt = f"""
             Analyze the following transcript and provide:
             1. A concise summary
             2. Key points discussed
@@ -161,23 +408,7 @@ class MediaProcessor:
                 ]
             }}
             """
-
-            response = await self.client.chat(
-                model='llama3.2',
-                messages=[{'role': 'user', 'content': prompt}],
-                format='json'
-            )
-            
-            try:
-                analysis_data = json.loads(response['message']['content'])
-            except json.JSONDecodeError:
-                analysis_data = {
-                    "summary": response['message']['content'],
-                    "key_points": [],
-                    "topics": [],
-                    "key_moments": []
-                }
-            
+                analysis_data = await self._chat_json(prompt, ANALYSIS_SECTIONS, use_cache)
             
             await self.save_analysis(analysis=analysis_data, base_name='ai_lecture')
 
@@ -187,97 +418,434 @@ class MediaProcessor:
         except Exception as e:
             raise RuntimeError(f"Transcript analysis failed: {str(e)}")
 
+    async def _map_reduce_analysis(self, transcript_text: str, use_cache: bool = True) -> Dict[str, Any]:
+        """Analyze transcript windows concurrently, then merge them into one analysis."""
+        windows = self._split_transcript(transcript_text)
+        self.print_with_flush(f" {len(windows)} windows...")
+        semaphore = asyncio.Semaphore(self.analysis_concurrency)
+
+        async def analyze_window(index: int, window: str) -> Dict[str, Any]:
+            prompt = f"""
+            The following is part {index + 1} of {len(windows)} of a lecture transcript.
+            Each line starts with [start -> end] times in seconds.
+
+            Transcript part:
+            {window}
+
+            Respond in the following JSON format:
+            {{
+                "summary": "2-3 sentence summary of this part",
+                "key_points": ["point1", "point2", ...],
+                "topics": ["topic1", "topic2", ...],
+                "key_moments": [
+                    {{"timestamp": "HH:MM:SS", "description": "string"}}
+                ]
+            }}
+            """
+            async with semaphore:
+                return await self._chat_json(prompt, WINDOW_SECTIONS, use_cache)
+
+        partials = await asyncio.gather(*[
+            analyze_window(index, window) for index, window in enumerate(windows)
+        ])
+
+        part_summaries = "\n".join(
+            f"Part {index + 1}: {partial.get('summary', '')}" for index, partial in enumerate(partials)
+        )
+        key_points = [point for partial in partials for point in partial.get('key_points', [])]
+        topics = [topic for partial in partials for topic in partial.get('topics', [])]
+
+        reduce_prompt = f"""
+            These are summaries, key points and topics of consecutive parts of one lecture.
+
+            Part summaries:
+            {part_summaries}
+
+            Key points:
+            {json.dumps(key_points)}
 
-    async def extract_keyframes(self, mp4_path: Path, key_moments: list = None, analysis_path: Path=None) -> Path:
-        """Extract images from key moments in the MP4 file."""
+            Topics:
+            {json.dumps(topics)}
+
+            Merge them into a single analysis of the whole lecture. Remove duplicates.
+            Respond in the following JSON format:
+            {{
+                "title": "string",
+                "summary": "string",
+                "key_points": ["point1", "point2", ...],
+                "topics": ["topic1", "topic2", ...]
+            }}
+            """
+        # An unparseable merge reply comes back with empty lists; the window results are kept instead
+        merged = await self._chat_json(reduce_prompt, REDUCE_SECTIONS, use_cache)
+
+        # Key moments already carry timestamps, so they are merged locally rather than by the LLM
+        key_moments, seen = [], set()
+        for partial in partials:
+            for moment in partial.get('key_moments', []):
+                if not isinstance(moment, dict):
+                    continue
+                marker = (moment.get('timestamp'), moment.get('description'))
+                if marker not in seen:
+                    seen.add(marker)
+                    key_moments.append(moment)
+
+        last_line = transcript_text.strip().splitlines()[-1] if transcript_text.strip() else ""
+        return {
+            "title": merged.get("title") or "",
+            "duration": last_line.split("->")[-1].split("]")[0].strip() if "->" in last_line else "",
+            "summary": merged.get("summary") or part_summaries,
+            "key_points": merged.get("key_points") or key_points,
+            "topics": merged.get("topics") or topics,
+            "key_moments": key_moments
+        }
+
+
+    async def extract_keyframes(
+        self,
+        mp4_path: Path,
+        key_moments: list = None,
+        analysis_path: Path = None,
+        media_hash: str = None
+    ) -> Path:
+        """Extract images from key moments in the MP4 file, or at slide changes when there are none.
+
+        A ``manifest.json`` describing every frame is written next to the images.
+        """
+        mp4_path = Path(mp4_path)
         if not mp4_path.exists():
             raise FileNotFoundError(f"Video file not found: {mp4_path}")
         
-        if key_moments is None:
+        if key_moments is None and analysis_path is not None:
             # Load key moments from the analysis file if provided
-            if analysis_path is None or not analysis_path.exists():
-                raise ValueError("Either key_moments or a valid analysis_path must be provided")
+            if not analysis_path.exists():
+                raise ValueError(f"Analysis file not found: {analysis_path}")
             
             with analysis_path.open("r") as file:
                 analysis_data = json.load(file)
                 key_moments = analysis_data.get("key_moments", [])
 
+        media_hash = media_hash or await asyncio.to_thread(self.cache.hash_file, mp4_path)
+        key_moments = self._normalize_moments(key_moments or [])
+        if not key_moments:
+            self.print_with_flush("No usable key moments, falling back to slide detection\n")
+            key_moments = await self.detect_slides(mp4_path, media_hash)
         if not key_moments:
-            raise ValueError("No key moments provided in either argument or analysis file")
+            raise ValueError("No key moments provided and no slide changes detected")
+
+        cache_key = self.cache.key(
+            "keyframes", media_hash,
+            key_moments=key_moments, dedup_threshold=self.keyframe_dedup_threshold
+        )
+        cached = await self.cache.get_async(cache_key)
+        if cached is not None:
+            self.print_with_flush("Using cached keyframes\n")
+            return Path(cached)
         
         base_name = mp4_path.stem
         keyframes_subdir = self.keyframes_dir / base_name
         keyframes_subdir.mkdir(parents=True, exist_ok=True)
         
-        processes = []
+        frames = []
+        descriptions = {}
         for idx, moment in enumerate(key_moments):
-            timestamp = moment.get('timestamp', '00:00:00')
+            timestamp = moment['timestamp']
             # Sanitize description for filename
             description = ''.join(c for c in moment.get('description', '')[:30] 
                                 if c.isalnum() or c in (' ', '_', '-')).strip()
             output_path = keyframes_subdir / f"frame_{idx:03d}_{timestamp}_{description}.jpg"
-            
-            try:
-                stream = ffmpeg.input(str(mp4_path), ss=timestamp)
-                stream = ffmpeg.output(stream, str(output_path), 
-                                     vframes=1, 
-                                     **{'q:v': 2})
-                ffmpeg.run(stream, capture_stdout=True, capture_stderr=True)
-            except ffmpeg.Error as e:
-                print(f"Warning: Failed to extract frame at {timestamp}: {str(e)}")
-                continue
+            frames.append((idx, timestamp, output_path))
+            descriptions[idx] = moment.get('description', '')
+
+        # Each pass is one ffmpeg process with a seeked input per timestamp in its batch, so
+        # 30 key moments cost a handful of process startups instead of 30. The file is still
+        # opened and seeked once per frame: a single input with a select filter would decode
+        # everything between the moments, which is slower for moments spread over a lecture.
+        start_time = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.keyframe_parallel_passes)
+        batches = [
+            frames[i:i + self.keyframe_batch_size]
+            for i in range(0, len(frames), self.keyframe_batch_size)
+        ]
+        results = await asyncio.gather(*[
+            self._extract_frame_batch(mp4_path, batch, semaphore) for batch in batches
+        ])
+        timings = sorted(t for batch_timings, _ in results for t in batch_timings)
+
+        for number, (batch_timings, elapsed) in enumerate(results):
+            print(f"  pass {number}: {len(batch_timings)} frames in {elapsed * 1000:.0f} ms")
+        print(
+            f"Extracted {len(timings)}/{len(frames)} keyframes in "
+            f"{time.perf_counter() - start_time:.2f}s using {len(batches)} ffmpeg passes"
+        )
+
+        paths = {idx: output_path for idx, _, output_path in frames}
+        entries = [
+            manifest_entry(
+                idx, timestamp, descriptions[idx], paths[idx], elapsed * 1000 if elapsed is not None else None
+            )
+            for idx, timestamp, elapsed in timings if paths[idx].exists()
+        ]
+        extra = {
+            "source": mp4_path.name,
+            "passes": [
+                {"frames": [idx for idx, _, _ in batch_timings], "ms": round(elapsed * 1000, 1)}
+                for batch_timings, elapsed in results
+            ],
+        }
+        if self.keyframe_dedup_threshold is not None and len(entries) > 1:
+            entries, extra["dedup"] = await dedupe_frames(
+                keyframes_subdir, entries, self.keyframe_dedup_threshold, timeout=self.ffmpeg_timeout
+            )
+            print(
+                f"Deduplicated keyframes: {extra['dedup']['images_stored']}/{len(entries)} images kept, "
+                f"{extra['dedup']['bytes_saved'] / 1024:.1f} KiB saved"
+            )
+        write_manifest(keyframes_subdir, entries, **extra)
         
+        await self.cache.put_async(cache_key, str(keyframes_subdir), paths=[keyframes_subdir])
         return keyframes_subdir
+
+    @staticmethod
+    def _normalize_moments(key_moments: List[Any]) -> List[Dict[str, str]]:
+        """Bring key moment timestamps to ``HH:MM:SS.mmm``, dropping unreadable and repeated ones."""
+        moments, seen = [], set()
+        for moment in key_moments:
+            if not isinstance(moment, dict):
+                continue
+            timestamp = normalize_timestamp(moment.get('timestamp'))
+            if timestamp is None:
+                print(f"Warning: Skipping key moment with unreadable timestamp {moment.get('timestamp')!r}")
+                continue
+            if timestamp not in seen:
+                seen.add(timestamp)
+                moments.append({"timestamp": timestamp, "description": str(moment.get('description', ''))})
+        return sorted(moments, key=lambda moment: moment['timestamp'])
+
+    async def detect_slides(self, mp4_path: Path, media_hash: str = None) -> List[Dict[str, str]]:
+        """Find slide changes in the video and return them as key moments, without the LLM."""
+        mp4_path = Path(mp4_path)
+        media_hash = media_hash or await asyncio.to_thread(self.cache.hash_file, mp4_path)
+        cache_key = self.cache.key(
+            "slides", media_hash,
+            fps=self.slide_detection_fps, threshold=self.slide_change_threshold
+        )
+        cached = await self.cache.get_async(cache_key)
+        if cached is not None:
+            return cached
+
+        start_time = time.perf_counter()
+        try:
+            moments = await detect_slides(
+                mp4_path,
+                fps=self.slide_detection_fps,
+                threshold=self.slide_change_threshold,
+                timeout=self.ffmpeg_timeout
+            )
+        except ffmpeg.Error as e:
+            raise RuntimeError(f"Slide detection failed: {describe_error(e)}")
+        print(f"Detected {len(moments)} slides in {time.perf_counter() - start_time:.2f}s")
+
+        await self.cache.put_async(cache_key, moments)
+        return moments
     
-    async def process_media(self, mp4_path: str | Path) -> Dict[str, Any]:
-        """Main async processing pipeline."""
+    async def _transcribe_media(
+        self,
+        mp4_path: Path,
+        on_segments: Optional[SegmentCallback] = None,
+        model_name: Optional[str] = None,
+        stream: bool = False
+    ) -> Tuple[Path, Dict[str, Any]]:
+        """Decode the audio of ``mp4_path`` and transcribe it."""
+        if self.in_memory_audio:
+            audio = await self.extract_pcm(mp4_path)
+            try:
+                return await self.transcribe_audio(
+                    audio, name=mp4_path.stem, on_segments=on_segments, model_name=model_name, stream=stream
+                )
+            finally:
+                if isinstance(audio, SharedAudio):
+                    audio.close()
+
+        wav_path = await self.extract_audio(mp4_path)
         try:
-            wav_path = await self.extract_audio(mp4_path)
-            transcript_path, transcript_result = await self.transcribe_audio(wav_path)
-            analysis = await self.analyze_transcript(transcript_path)
-            keyframes_dir = await self.extract_keyframes(self.mp4_path, analysis.get('key_moments', []))
-            
-            # Cleanup
+            return await self.transcribe_audio(
+                wav_path, on_segments=on_segments, model_name=model_name, stream=stream
+            )
+        finally:
             try:
-                if wav_path.exists():
-                    wav_path.unlink()
+                wav_path.unlink(missing_ok=True)
             except Exception as e:
                 print(f"Warning: Failed to cleanup temporary file {wav_path}: {str(e)}")
+
+    def _transcript_cache_key(self, media_hash: str, model_name: str) -> str:
+        return self.cache.key(
+            "transcript", media_hash,
+            whisper_model=model_name, language=self.language
+        )
+
+    async def _cached_segments(self, media_hash: str, model_name: str, transcript_path: str) -> List[Dict[str, Any]]:
+        """Segments of an already transcribed video, for replaying to stream subscribers."""
+        cached = await self.cache.get_async(self._transcript_cache_key(media_hash, model_name))
+        if cached is not None:
+            return cached['transcript']['segments']
+        # The transcript entry can be gone while the pipeline entry survives; the text file has the segments too
+        return await asyncio.to_thread(parse_transcript, Path(transcript_path))
+
+    async def _extract_frame_batch(
+        self,
+        mp4_path: Path,
+        batch: List[Tuple[int, str, Path]],
+        semaphore: asyncio.Semaphore
+    ) -> Tuple[List[Tuple[int, str, Optional[float]]], float]:
+        """Extract a batch of frames with a single ffmpeg process.
+
+        Returns ``(index, timestamp, seconds)`` per written frame, with seconds
+        only measured for frames extracted one by one, and the pass time.
+        """
+        def frame_output(timestamp: str, output_path: Path):
+            # Map only the video stream; a bare "-map N" would also route audio into the JPEG
+            stream = ffmpeg.input(str(mp4_path), ss=timestamp).video
+            return ffmpeg.output(stream, str(output_path), vframes=1, **{'q:v': 2})
+
+        async with semaphore:
+            pass_start = time.perf_counter()
+            try:
+                await run_ffmpeg(
+                    ffmpeg.merge_outputs(*[frame_output(ts, path) for _, ts, path in batch]),
+                    timeout=self.ffmpeg_timeout
+                )
+                return [(idx, ts, None) for idx, ts, _ in batch], time.perf_counter() - pass_start
+            except (ffmpeg.Error, TimeoutError):
+                # A single unparseable timestamp fails the whole pass; retry frame by frame
+                pass
+
+            timings = []
+            for idx, timestamp, output_path in batch:
+                start_time = time.perf_counter()
+                try:
+                    await run_ffmpeg(frame_output(timestamp, output_path), timeout=self.ffmpeg_timeout)
+                    timings.append((idx, timestamp, time.perf_counter() - start_time))
+                except (ffmpeg.Error, TimeoutError) as e:
+                    message = describe_error(e) if isinstance(e, ffmpeg.Error) else str(e)
+                    print(f"Warning: Failed to extract frame at {timestamp}: {message}")
+            return timings, time.perf_counter() - pass_start
+
+    async def process_media(
+        self,
+        mp4_path: str | Path,
+        media_hash: str = None,
+        on_segments: Optional[SegmentCallback] = None,
+        model_name: Optional[str] = None,
+        stream: bool = False
+    ) -> Dict[str, Any]:
+        """Main async processing pipeline.
+
+        Slides detected alongside transcription supply the keyframes in
+        ``"scenes"`` mode, and in ``"auto"`` mode when the analysis has none.
+        """
+        mp4_path = Path(mp4_path)
+        model_name = model_name or self.default_whisper_model
+        try:
+            media_hash = media_hash or await asyncio.to_thread(self.cache.hash_file, mp4_path)
+            cache_key = self.cache.key(
+                "process_media", media_hash,
+                whisper_model=model_name, language=self.language, llm_model=self.llm_model,
+                keyframe_mode=self.keyframe_mode, keyframe_dedup_threshold=self.keyframe_dedup_threshold,
+                slide_detection_fps=self.slide_detection_fps, slide_change_threshold=self.slide_change_threshold
+            )
+            cached = await self.cache.get_async(cache_key)
+            if cached is not None:
+                self.print_with_flush("Using cached media processing result\n")
+                if on_segments is not None:
+                    await on_segments(await self._cached_segments(media_hash, model_name, cached['transcript_path']))
+                return cached
+
+            # Slide detection only needs the video, so it overlaps with transcription
+            slides_task = None
+            if self.keyframe_mode != "llm":
+                slides_task = asyncio.create_task(self.detect_slides(mp4_path, media_hash))
+
+            try:
+                transcript_key = self._transcript_cache_key(media_hash, model_name)
+                cached_transcript = await self.cache.get_async(transcript_key)
+                if cached_transcript is not None:
+                    transcript_path = Path(cached_transcript['transcript_path'])
+                    if on_segments is not None:
+                        await on_segments(cached_transcript['transcript']['segments'])
+                else:
+                    transcript_path, transcript_result = await self._transcribe_media(mp4_path, on_segments, model_name, stream)
+                    await self.cache.put_async(
+                        transcript_key,
+                        {'transcript_path': str(transcript_path), 'transcript': transcript_result},
+                        paths=[transcript_path]
+                    )
+
+                if self.keyframe_mode == "llm":
+                    analysis = await self.analyze_transcript(transcript_path)
+                else:
+                    try:
+                        analysis = await self.analyze_transcript(transcript_path)
+                    except RuntimeError as e:
+                        print(f"Warning: {str(e)}; keyframes will use slide changes")
+                        analysis = {"error": str(e), "key_moments": []}
+                key_moments = self._normalize_moments(analysis.get('key_moments', []))
+
+                if slides_task is not None and (self.keyframe_mode == "scenes" or not key_moments):
+                    key_moments = await slides_task
+            finally:
+                if slides_task is not None:
+                    if not slides_task.done():
+                        slides_task.cancel()
+                    elif not slides_task.cancelled():
+                        # Retrieve an unused failure so it is not reported as never retrieved
+                        slides_task.exception()
+
+            keyframes_dir = await self.extract_keyframes(mp4_path, key_moments, media_hash=media_hash)
+            with open(keyframes_dir / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+                keyframe_dedup = json.load(f).get("dedup")
             
-            return {
+            result = {
                 'transcript_path': str(transcript_path),
                 'analysis': analysis,
-                'keyframes_dir': str(keyframes_dir)
+                'keyframes_dir': str(keyframes_dir),
+                'keyframe_dedup': keyframe_dedup
             }
+            # A failed analysis (e.g. Ollama unreachable) is retried the next time this media is processed;
+            # the transcript and keyframes are cached on their own
+            if "error" not in analysis:
+                await self.cache.put_async(cache_key, result, paths=[transcript_path, keyframes_dir])
+            return result
             
         except Exception as e:
-            # Cleanup on failure
-            try:
-                if 'wav_path' in locals() and wav_path.exists():
-                    wav_path.unlink()
-            except Exception:
-                pass
             raise RuntimeError(f"Media processing failed: {str(e)}")
         
-    async def generate_transcript(self, mp4_path: str | Path) -> Dict[str, Any]:
+    async def generate_transcript(
+        self,
+        mp4_path: str | Path,
+        media_hash: str = None,
+        on_segments: Optional[SegmentCallback] = None,
+        model_name: Optional[str] = None,
+        stream: bool = False
+    ) -> Dict[str, Any]:
+        mp4_path = Path(mp4_path)
+        model_name = model_name or self.default_whisper_model
         try:
-            wav_path = await self.extract_audio(mp4_path)
-            transcript_path, transcript_result = await self.transcribe_audio(wav_path)
+            media_hash = media_hash or await asyncio.to_thread(self.cache.hash_file, mp4_path)
+            cache_key = self._transcript_cache_key(media_hash, model_name)
+            cached = await self.cache.get_async(cache_key)
+            if cached is not None:
+                self.print_with_flush("Using cached transcript\n")
+                if on_segments is not None:
+                    await on_segments(cached['transcript']['segments'])
+                return cached
 
-            try:
-                if wav_path.exists():
-                    wav_path.unlink()
-            except Exception as e:
-                print(f"Warning: Failed to cleanup temporary file {wav_path}: {str(e)}")
+            transcript_path, transcript_result = await self._transcribe_media(mp4_path, on_segments, model_name, stream)
 
-            return {'transcript_path': str(transcript_path), 'transcript': transcript_result}
+            result = {'transcript_path': str(transcript_path), 'transcript': transcript_result}
+            await self.cache.put_async(cache_key, result, paths=[transcript_path])
+            return result
         except Exception as e:
-            # Cleanup on failure
-            try:
-                if 'wav_path' in locals() and wav_path.exists():
-                    wav_path.unlink()
-            except Exception:
-                pass
             raise RuntimeError(f"Media processing failed: {str(e)}")
 
 
@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+class LLMCache:
+    """On-disk cache of LLM responses shared by all assistants.
+
+    Entries are keyed on the model, a hash of the messages, the response
+    format and the generation options. The cache is bounded by total size
+    (least recently used entries are evicted first) and entries older than
+    ``ttl_seconds`` are treated as misses. The directory is scanned once on
+    startup; from then on an in-memory LRU index of entry sizes answers
+    misses and picks eviction victims without touching the disk. The async
+    gateway uses ``get_async``/``put_async``, which do the file I/O in a
+    worker thread.
+    """
+
+    def __init__(
+        self,
+        base_dir: str | Path = "media_storage",
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: float = 7 * 86400
+    ):
+        self.cache_dir = Path(base_dir) / "llm_cache"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        # Key -> entry size in bytes, least recently used first (mtimes carry recency across restarts)
+        entries = []
+        for entry_path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = entry_path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, entry_path.stem, stat.st_size))
+        self._index: "OrderedDict[str, int]" = OrderedDict(
+            (key, size) for _, key, size in sorted(entries)
+        )
+        self._size = sum(self._index.values())
+
+    @staticmethod
+    def key(model: str, messages: List[Dict[str, Any]], format: Optional[str] = None,
+            options: Optional[Dict[str, Any]] = None) -> str:
+        """Build the cache key of a chat request."""
+        prompt_hash = hashlib.sha256(
+            json.dumps(messages, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+        payload = json.dumps(
+            {"model": model, "prompt": prompt_hash, "format": format, "options": options or {}},
+            sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response content for ``key``, or None on a miss."""
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        if time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+        # Bump the mtime so the LRU order survives a restart
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry["content"]
+
+    def put(self, key: str, content: str, model: str) -> None:
+        """Store ``content`` under ``key`` and evict old entries if over the size limit."""
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = entry_path.with_name(f".{key}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"created_at": time.time(), "model": model, "content": content}, f)
+        size = tmp_path.stat().st_size
+        tmp_path.replace(entry_path)
+
+        with self._lock:
+            self._size += size - self._index.pop(key, 0)
+            self._index[key] = size
+            victims = []
+            if self._size > self.max_bytes:
+                # Evict down to 90% so a burst of puts does not evict on every call
+                target = self.max_bytes * 0.9
+                while self._size > target and len(self._index) > 1:
+                    victim, victim_size = self._index.popitem(last=False)
+                    self._size -= victim_size
+                    victims.append(victim)
+            self.evictions += len(victims)
+
+        for victim in victims:
+            try:
+                self._entry_path(victim).unlink()
+            except OSError:
+                pass
+
+    async def get_async(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def put_async(self, key: str, content: str, model: str) -> None:
+        await asyncio.to_thread(self.put, key, content, model)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "size_bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
+
+    def _remove(self, key: str) -> None:
+        with self._lock:
+            size = self._index.pop(key, None)
+            if size is None:
+                return
+            self._size -= size
+        try:
+            self._entry_path(key).unlink()
+        except OSError:
+            pass
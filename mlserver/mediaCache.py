@@ -0,0 +1,78 @@
+import asyncio
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+CHUNK_SIZE = 1024 * 1024  # 1 MiB
+
+
+class ArtifactCache:
+    """Content-addressed cache of derived media artifacts.
+
+    Entries are keyed by the SHA-256 of the source media plus the pipeline
+    parameters that produced them. An entry is only served while every
+    artifact path it references still exists on disk. Coroutines use
+    ``get_async``/``put_async``, which do the JSON file I/O in a thread.
+    """
+
+    def __init__(self, base_dir: str | Path = "media_storage"):
+        self.cache_dir = Path(base_dir) / "cache"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def hash_file(path: str | Path) -> str:
+        """Compute the SHA-256 of a file in chunks."""
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    @staticmethod
+    def key(kind: str, media_hash: str, **params) -> str:
+        """Build the cache key for an artifact of ``kind`` derived from ``media_hash``."""
+        payload = json.dumps({"kind": kind, "media": media_hash, "params": params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached result for ``key``, or None on a miss or stale entry."""
+        entry_path = self._entry_path(key)
+        if not entry_path.exists():
+            return None
+
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        if not all(Path(p).exists() for p in entry.get("paths", [])):
+            # The artifacts were removed behind our back; drop the stale entry
+            entry_path.unlink(missing_ok=True)
+            return None
+        return entry["result"]
+
+    def put(self, key: str, result: Any, paths: Iterable[str | Path] = ()) -> None:
+        """Store ``result`` together with the artifact paths it depends on."""
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "created_at": time.time(),
+            "paths": [str(p) for p in paths],
+            "result": result,
+        }
+        tmp_path = entry_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, default=str)
+        tmp_path.replace(entry_path)
+
+    async def get_async(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def put_async(self, key: str, result: Any, paths: Iterable[str | Path] = ()) -> None:
+        await asyncio.to_thread(self.put, key, result, paths)
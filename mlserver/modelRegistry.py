@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Iterable, List, Optional
+
+# Approximate fp32 weight size of each Whisper checkpoint, used to plan evictions before loading
+MODEL_SIZES_MB = {
+    "tiny": 150,
+    "tiny.en": 150,
+    "base": 290,
+    "base.en": 290,
+    "small": 970,
+    "small.en": 970,
+    "medium": 3060,
+    "medium.en": 3060,
+    "large-v1": 6170,
+    "large-v2": 6170,
+    "large-v3": 6170,
+    "large": 6170,
+    "turbo": 3240,
+}
+AVAILABLE_MODELS = tuple(MODEL_SIZES_MB)
+
+
+class WhisperModelRegistry:
+    """Load Whisper models on first use and keep them in a memory-bounded LRU.
+
+    torch and whisper are only imported when the first model is requested,
+    so importing this module is cheap.
+    """
+
+    def __init__(self, memory_budget_mb: int = 4096, device: Optional[str] = None):
+        self.memory_budget_mb = memory_budget_mb
+        self._device = device
+        self._models: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes_mb: dict = {}
+        self._lock = threading.Lock()
+
+    @property
+    def device(self) -> str:
+        if self._device is None:
+            import torch
+            self._device = "cuda" if torch.cuda.is_available() else "cpu"
+        return self._device
+
+    @property
+    def used_mb(self) -> float:
+        return sum(self._sizes_mb.values())
+
+    def loaded(self) -> List[str]:
+        return list(self._models)
+
+    def get(self, name: str):
+        """Return the model ``name``, loading it (and evicting others) if needed."""
+        if name not in MODEL_SIZES_MB:
+            raise ValueError(f"Unknown Whisper model '{name}'. Available: {', '.join(AVAILABLE_MODELS)}")
+
+        with self._lock:
+            if name in self._models:
+                self._models.move_to_end(name)
+                return self._models[name]
+
+            self._evict_for(MODEL_SIZES_MB[name])
+
+            import whisper
+            print(f"Loading Whisper model '{name}' on {self.device}...", end='', flush=True)
+            model = whisper.load_model(name, device=self.device)
+            print(" Done!", flush=True)
+
+            self._models[name] = model
+            self._sizes_mb[name] = sum(p.numel() * p.element_size() for p in model.parameters()) / (1024 * 1024)
+            return model
+
+    def warm_up(self, names: Iterable[str]) -> None:
+        """Load ``names`` ahead of the first request."""
+        for name in names:
+            self.get(name)
+
+    def _evict_for(self, needed_mb: float) -> None:
+        # Always allow at least one model, even if it alone exceeds the budget
+        while self._models and self.used_mb + needed_mb > self.memory_budget_mb:
+            name, _ = self._models.popitem(last=False)
+            self._sizes_mb.pop(name, None)
+            print(f"Evicted Whisper model '{name}' to stay within {self.memory_budget_mb} MB", flush=True)
+
+        if self._device == "cuda":
+            import torch
+            torch.cuda.empty_cache()
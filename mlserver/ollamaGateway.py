@@ -0,0 +1,254 @@
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence
+
+import httpx
+from ollama import AsyncClient
+
+from llmCache import LLMCache
+from jsonRepair import merge_sections, missing_sections, repair_json
+
+
+class OllamaGateway:
+    """Single entry point for Ollama chat requests shared by all assistants.
+
+    One pooled HTTP client is reused for every request, at most
+    ``max_concurrency`` generations are in flight at once (the rest wait
+    here rather than inside Ollama), and identical concurrent requests are
+    coalesced into a single generation. Responses go through ``cache`` and
+    every request asks Ollama to keep the model loaded for ``keep_alive``.
+    """
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        max_concurrency: int = 4,
+        keep_alive: str = "30m",
+        cache: Optional[LLMCache] = None,
+        timeout: float = 600
+    ):
+        self.keep_alive = keep_alive
+        self.cache = cache or LLMCache()
+        self.client = AsyncClient(
+            host=host,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency * 2, max_keepalive_connections=max_concurrency)
+        )
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending: Dict[str, asyncio.Task] = {}
+        self.in_flight = 0
+        self.waiting = 0
+        self.generations = 0
+        self.coalesced = 0
+        self.repairs = 0
+        self.follow_ups = 0
+
+    async def chat(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        format: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True
+    ) -> str:
+        """Return the response content of a chat request.
+
+        With ``use_cache=False`` the cache is neither read nor written, but
+        the request can still join an identical generation already running.
+        JSON-format responses are only cached when they parse.
+        """
+        key = LLMCache.key(model, messages, format, options)
+        if use_cache:
+            cached = await self.cache.get_async(key)
+            if cached is not None:
+                return cached
+
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.create_task(self._generate(model, messages, format, options))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        # Shield the shared generation so one caller disconnecting does not cancel it for the others
+        content = await asyncio.shield(task)
+
+        if use_cache:
+            await self._store(key, content, model, format)
+        return content
+
+    async def _store(self, key: str, content: str, model: str, format: Optional[str]) -> None:
+        # A malformed JSON generation is not worth replaying
+        if format == 'json':
+            try:
+                json.loads(content)
+            except json.JSONDecodeError:
+                return
+        await self.cache.put_async(key, content, model)
+
+    async def chat_json(
+        self,
+        model: str,
+        prompt: str,
+        sections: Sequence[str] = (),
+        root: Sequence[str] = (),
+        use_cache: bool = True,
+        system: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Request a JSON object, repairing truncated output and re-requesting only what is missing.
+
+        ``sections`` are the keys expected at ``root``; absent ones are asked for
+        in one follow-up turn. Raises ``json.JSONDecodeError`` when nothing can be
+        salvaged or the reply is not an object.
+        """
+        messages = [{'role': 'user', 'content': prompt}]
+        if system is not None:
+            messages.insert(0, {'role': 'system', 'content': system})
+        content = await self.chat(model=model, messages=messages, format='json', use_cache=use_cache)
+        repaired = False
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError as e:
+            data = repair_json(content)
+            if not isinstance(data, dict):
+                raise e
+            repaired = True
+            self.repairs += 1
+            print(f"Repaired malformed JSON from {model} ({len(content)} chars)", flush=True)
+        if not isinstance(data, dict):
+            # Valid JSON of the wrong type is as unusable as a parse error
+            raise json.JSONDecodeError(f"Expected a JSON object, got {type(data).__name__}", content, 0)
+
+        # An empty section is only suspicious when the output was cut short
+        missing = missing_sections(data, root, sections, allow_empty=not repaired)
+        if missing:
+            await self.complete_json(model, messages, data, root, missing, use_cache=use_cache)
+        return data
+
+    async def complete_json(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        data: Dict[str, Any],
+        root: Sequence[str],
+        missing: Sequence[str],
+        instructions: str = "",
+        use_cache: bool = True
+    ) -> List[str]:
+        """Ask for the ``missing`` sections of ``data`` in a follow-up turn and merge them in.
+
+        The partial result is replayed as the assistant turn so the model sees
+        what it already produced. Returns the sections that were filled.
+        """
+        self.follow_ups += 1
+        wrapper = "".join(f'{{"{key}": ' for key in root) + "..." + "}" * len(root)
+        follow_up = messages + [
+            {'role': 'assistant', 'content': json.dumps(data)},
+            {'role': 'user', 'content': (
+                f"Your answer is incomplete. Respond with JSON in the same structure ({wrapper}) "
+                f"containing only these sections: {', '.join(missing)}. {instructions}"
+            ).strip()},
+        ]
+        content = await self.chat(model=model, messages=follow_up, format='json', use_cache=use_cache)
+        try:
+            reply = json.loads(content)
+        except json.JSONDecodeError:
+            reply = repair_json(content)
+
+        filled = merge_sections(data, root, reply, missing)
+        print(f"Follow-up filled {len(filled)}/{len(missing)} missing sections: {', '.join(filled) or 'none'}", flush=True)
+        return filled
+
+    async def _generate(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        format: Optional[str],
+        options: Optional[Dict[str, Any]]
+    ) -> str:
+        kwargs: Dict[str, Any] = {"keep_alive": self.keep_alive}
+        if format is not None:
+            kwargs["format"] = format
+        if options is not None:
+            kwargs["options"] = options
+
+        self.waiting += 1
+        async with self._semaphore:
+            self.waiting -= 1
+            self.in_flight += 1
+            self.generations += 1
+            try:
+                response = await self.client.chat(model=model, messages=messages, **kwargs)
+            finally:
+                self.in_flight -= 1
+        return response['message']['content']
+
+    async def chat_stream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        format: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True
+    ) -> AsyncIterator[str]:
+        """Yield the response content of a chat request piece by piece as it is generated.
+
+        A cached response is yielded in one piece. Streamed requests hold a
+        concurrency slot for the whole generation and are not coalesced.
+        """
+        key = LLMCache.key(model, messages, format, options)
+        if use_cache:
+            cached = await self.cache.get_async(key)
+            if cached is not None:
+                yield cached
+                return
+
+        kwargs: Dict[str, Any] = {"keep_alive": self.keep_alive}
+        if format is not None:
+            kwargs["format"] = format
+        if options is not None:
+            kwargs["options"] = options
+
+        parts = []
+        self.waiting += 1
+        async with self._semaphore:
+            self.waiting -= 1
+            self.in_flight += 1
+            self.generations += 1
+            try:
+                async for part in await self.client.chat(model=model, messages=messages, stream=True, **kwargs):
+                    content = part['message']['content']
+                    if content:
+                        parts.append(content)
+                        yield content
+            finally:
+                self.in_flight -= 1
+
+        if use_cache:
+            await self._store(key, "".join(parts), model, format)
+
+    async def warm_up(self, models: Iterable[str]) -> None:
+        """Load ``models`` into Ollama ahead of the first request and keep them loaded."""
+        for model in models:
+            start_time = time.time()
+            try:
+                # An empty prompt only loads the model
+                await self.client.generate(model=model, prompt="", keep_alive=self.keep_alive)
+                print(f"Ollama model '{model}' loaded in {time.time() - start_time:.1f}s", flush=True)
+            except Exception as e:
+                print(f"Warning: Failed to preload Ollama model '{model}': {str(e)}", flush=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "generations": self.generations,
+            "coalesced": self.coalesced,
+            "repairs": self.repairs,
+            "follow_ups": self.follow_ups,
+            "cache": self.cache.stats(),
+        }
@@ -0,0 +1,163 @@
+import re
+from typing import Any, Dict, List, Set, Tuple
+
+# Words that say nothing about which module a material belongs to
+STOPWORDS = {
+    "the", "and", "for", "with", "from", "into", "that", "this", "are", "how", "what", "use", "using",
+    "understand", "analyze", "compare", "explain", "describe", "different", "guide", "introduction",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for llama-style tokenizers (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def _terms(text: str) -> Set[str]:
+    return {w for w in re.findall(r"[a-z0-9/+]+", text.lower()) if len(w) > 2 and w not in STOPWORDS}
+
+
+def dedupe_topics(topics: List[str]) -> List[str]:
+    """Drop repeated topics (case and whitespace insensitive), keeping the first spelling."""
+    seen = set()
+    unique = []
+    for topic in topics:
+        norm = " ".join(topic.lower().split())
+        if norm and norm not in seen:
+            seen.add(norm)
+            unique.append(topic.strip())
+    return unique
+
+
+def rank_materials(materials: List[Dict], modules: Dict[str, Dict]) -> List[Tuple[float, Dict]]:
+    """Order materials so every module's best matches come first.
+
+    Each material is scored per module by how many terms of its topics and
+    description appear in the module's objectives (and name). Materials are
+    then taken round-robin from each module's ranking, so a large module
+    cannot crowd out a small one. Returns ``(best_score, material)`` pairs.
+    """
+    material_terms = [
+        _terms(" ".join(m.get('topics', [])) + " " + m.get('description', '')) for m in materials
+    ]
+    per_module = []
+    best = [0.0] * len(materials)
+    for name, details in modules.items():
+        objective_terms = _terms(name + " " + " ".join(details.get('objectives', [])))
+        scores = [
+            len(terms & objective_terms) / (len(terms) or 1) for terms in material_terms
+        ]
+        for i, score in enumerate(scores):
+            best[i] = max(best[i], score)
+        per_module.append(sorted(range(len(materials)), key=lambda i: -scores[i]))
+
+    order: List[int] = []
+    taken = set()
+    for position in range(len(materials)):
+        for ranking in per_module:
+            i = ranking[position]
+            if best[i] > 0 and i not in taken:
+                taken.add(i)
+                order.append(i)
+    # Materials that match no module keep their original order at the end
+    order.extend(i for i in range(len(materials)) if i not in taken)
+    return [(best[i], materials[i]) for i in order]
+
+
+def format_material(material: Dict, shared: Set[str] = frozenset()) -> str:
+    unique = dedupe_topics(material.get('topics', []))
+    topics = [t for t in unique if t.lower() not in shared]
+    topics = ', '.join(topics + (["(plus shared topics)"] if len(topics) < len(unique) else []))
+    return (
+        f"- Filename: {material['filename']}\n"
+        f"  Type: {material['type']}\n"
+        f"  Description: {material['description']}\n"
+        f"  Date Added: {material['date_added']}\n"
+        f"  Topics Covered: {topics}\n"
+        # f"  Difficulty Level: {material.get('difficulty', 'Intermediate')}\n"
+    )
+
+
+def build_materials_section(
+    materials: List[Dict], modules: Dict[str, Dict], budget_tokens: int
+) -> Tuple[str, Dict[str, Any]]:
+    """Format ``materials`` for a prompt within ``budget_tokens``.
+
+    The most relevant materials (see ``rank_materials``) are listed in full.
+    Topics shared by several of them are hoisted into one line. Once the
+    budget runs low the remaining ones are summarized as one line each,
+    filename and type only, with their topics listed once for the whole
+    tail. Anything that still does not fit is counted but omitted.
+    Returns the text and a report of how many tokens were saved.
+    """
+    full_text = "\n".join(format_material(m) for m in materials)
+    full_tokens = estimate_tokens(full_text)
+    if full_tokens <= budget_tokens:
+        return full_text, {
+            "tokens_full": full_tokens,
+            "tokens_used": full_tokens,
+            "tokens_saved": 0,
+            "materials_full": len(materials),
+            "materials_summarized": 0,
+            "materials_omitted": 0,
+        }
+
+    ranked = rank_materials(materials, modules)
+    # Keep a quarter of the budget for the compact tail
+    detail_budget = budget_tokens * 3 // 4
+    selected: List[Dict] = []
+    used = 0
+    index = 0
+    for index, (_, material) in enumerate(ranked):
+        cost = estimate_tokens(format_material(material))
+        if used + cost > detail_budget:
+            break
+        selected.append(material)
+        used += cost
+    else:
+        index = len(ranked)
+
+    # Topics covered by three or more listed materials are named once instead of in every entry
+    counts: Dict[str, int] = {}
+    for material in selected:
+        for topic in dedupe_topics(material.get('topics', [])):
+            counts[topic.lower()] = counts.get(topic.lower(), 0) + 1
+    shared = {topic for topic, count in counts.items() if count >= 3}
+    detailed = [format_material(material, shared) for material in selected]
+    if shared:
+        shared_topics = dedupe_topics([t for m in selected for t in m.get('topics', []) if t.lower() in shared])
+        detailed.insert(0, f"Shared topics (covered by several materials below): {', '.join(shared_topics)}\n")
+    used = estimate_tokens("\n".join(detailed))
+
+    tail = [material for _, material in ranked[index:]]
+    tail_topics = dedupe_topics([t for m in tail for t in m.get('topics', [])])
+    topics_line = f"  Topics across these materials: {', '.join(tail_topics)}\n"
+    remaining = budget_tokens - used - estimate_tokens(topics_line) - 20
+
+    lines = []
+    for material in tail:
+        line = f"  - {material['filename']} ({material['type']})"
+        cost = estimate_tokens(line)
+        if cost > remaining:
+            break
+        lines.append(line)
+        remaining -= cost
+    omitted = len(tail) - len(lines)
+
+    text = "\n".join(detailed)
+    if tail:
+        text += "\nADDITIONAL MATERIALS (less relevant, summarized):\n" + "\n".join(lines) + "\n"
+        if omitted:
+            text += f"  ... and {omitted} more\n"
+        if estimate_tokens(topics_line) < budget_tokens - estimate_tokens(text):
+            text += topics_line
+
+    used_tokens = estimate_tokens(text)
+    return text, {
+        "tokens_full": full_tokens,
+        "tokens_used": used_tokens,
+        "tokens_saved": full_tokens - used_tokens,
+        "materials_full": len(selected),
+        "materials_summarized": len(lines),
+        "materials_omitted": omitted,
+    }
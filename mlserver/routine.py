@@ -1,9 +1,13 @@
+import asyncio
 import json
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 from dataclasses import dataclass
 from enum import Enum
-from ollama import AsyncClient
+from ollamaGateway import OllamaGateway
+
+# Sections of the enrichment reply; missing ones are re-requested on their own
+ROUTINE_SECTIONS = ("blocks", "wellness_recommendations", "adaptation_strategies", "success_metrics")
 
 class TimeSlot(Enum):
     EARLY_MORNING = "early_morning"
@@ -37,10 +41,214 @@ class StudentPreferences:
     stress_level: Optional[int] = None  # 1-10 scale
     energy_patterns: Optional[Dict[str, int]] = None
 
+def _to_minutes(hhmm: str) -> int:
+    hours, minutes = hhmm.strip().split(":")
+    return int(hours) * 60 + int(minutes)
+
+def _to_hhmm(minutes: int) -> str:
+    minutes %= 24 * 60
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+class ScheduleEngine:
+    """Place the day's blocks deterministically from a student's preferences.
+
+    Fixed blocks (morning routine, meals, exercise, wind-down) are placed
+    first; study sessions then fill the free intervals, peak-productivity
+    intervals first and heaviest subjects first, separated by
+    ``break_duration`` breaks. Leftover evening time goes to hobbies. Times
+    are handled in minutes since midnight, so blocks never overlap and
+    never leave the wake/sleep window.
+    """
+
+    SESSION_MINUTES = 50
+    MIN_SESSION_MINUTES = 25
+    MIN_HOBBY_MINUTES = 30
+    MEAL_MINUTES = 30
+    EXERCISE_MINUTES = 45
+    ROUTINE_MINUTES = 30
+    HOBBY_MINUTES = 60
+
+    # Default start of exercise per preference, in hours
+    EXERCISE_START = {"morning": None, "afternoon": 16, "evening": 18}
+
+    def __init__(self, time_slots: Dict[TimeSlot, tuple]):
+        self.time_slots = time_slots
+
+    def build(self, preferences: StudentPreferences) -> Dict:
+        """Return ``{"schedule_blocks": [...], "unscheduled_study_minutes": n}``."""
+        wake = _to_minutes(preferences.wake_up_time)
+        sleep = _to_minutes(preferences.sleep_time)
+        if sleep <= wake:
+            sleep += 24 * 60
+
+        fixed = []
+
+        def reserve(start: int, duration: int, activity: str, activity_type: ActivityType):
+            start = max(start, wake)
+            end = min(start + duration, sleep)
+            if end > start and all(end <= s or start >= e for s, e, _, _ in fixed):
+                fixed.append((start, end, activity, activity_type))
+
+        reserve(wake, self.ROUTINE_MINUTES, "Morning routine", ActivityType.SELF_CARE)
+        for index, meal in enumerate(preferences.meal_times):
+            start = _to_minutes(meal)
+            if start < wake:
+                start += 24 * 60
+            reserve(start, self.MEAL_MINUTES, ("Breakfast", "Lunch", "Dinner")[index] if index < 3 else "Meal", ActivityType.MEALS)
+        reserve(sleep - self.ROUTINE_MINUTES, self.ROUTINE_MINUTES, "Wind-down", ActivityType.SELF_CARE)
+
+        exercise_hour = self.EXERCISE_START.get(preferences.exercise_preference.lower().strip())
+        exercise_start = wake + self.ROUTINE_MINUTES if exercise_hour is None else exercise_hour * 60
+        for candidate in self._free_intervals(fixed, wake, sleep):
+            # First free interval at or after the preferred time that fits the whole session
+            start = max(candidate[0], exercise_start)
+            if start + self.EXERCISE_MINUTES <= candidate[1]:
+                reserve(start, self.EXERCISE_MINUTES, "Exercise", ActivityType.EXERCISE)
+                break
+
+        blocks = list(fixed)
+        free = self._free_intervals(fixed, wake, sleep)
+        study_left = self._study_minutes(preferences)
+        for start, end in sorted(free, key=lambda interval: self._preference(interval, preferences)):
+            cursor = start
+            while study_left and cursor + self.MIN_SESSION_MINUTES <= end:
+                # Heaviest subject first, unless its session would not fit here without leaving a scrap
+                subject, length = next(
+                    (
+                        (subject, length)
+                        for subject in sorted(study_left, key=study_left.get, reverse=True)
+                        for length in [self._session_length(study_left[subject], end - cursor)]
+                        if length > 0
+                    ),
+                    (None, 0)
+                )
+                if not length:
+                    break
+                blocks.append((cursor, cursor + length, f"Study: {subject}", ActivityType.STUDY))
+                study_left[subject] -= length
+                if study_left[subject] <= 0:
+                    del study_left[subject]
+                cursor += length
+                if study_left and cursor + preferences.break_duration <= end:
+                    blocks.append((cursor, cursor + preferences.break_duration, "Break", ActivityType.BREAK))
+                    cursor += preferences.break_duration
+
+        # Hobbies take the longest remaining gaps in the second half of the day
+        midday = wake + (sleep - wake) // 2
+        gaps = sorted(
+            (
+                (max(start, midday), end) for start, end in self._free_intervals(blocks, wake, sleep)
+                if end - max(start, midday) >= self.MIN_HOBBY_MINUTES
+            ),
+            key=lambda g: g[0] - g[1]
+        )
+        for hobby, (start, end) in zip(preferences.hobbies, gaps):
+            blocks.append((start, min(end, start + self.HOBBY_MINUTES), hobby.capitalize(), ActivityType.HOBBY))
+
+        blocks.append((sleep, wake + 24 * 60, "Sleep", ActivityType.SLEEP))
+        blocks.sort()
+        return {
+            "schedule_blocks": [
+                {
+                    "time_slot": f"{_to_hhmm(start)}-{_to_hhmm(end)}",
+                    "activity": activity,
+                    "type": activity_type.value,
+                    "energy_level": self._energy_level(start, preferences),
+                    "details": [],
+                    "optimization_tips": [],
+                    "alternatives": []
+                }
+                for start, end, activity, activity_type in blocks
+            ],
+            "unscheduled_study_minutes": sum(study_left.values())
+        }
+
+    def _session_length(self, remaining: int, room: int) -> int:
+        """Length of the next session of a subject with ``remaining`` minutes, or 0 if none fits in ``room``.
+
+        Sessions are ``SESSION_MINUTES`` long, but a remainder shorter than
+        ``MIN_SESSION_MINUTES`` is folded into this session or left at a full
+        minimum session for later, never scheduled on its own.
+        """
+        length = min(self.SESSION_MINUTES, remaining, room)
+        rest = remaining - length
+        if 0 < rest < self.MIN_SESSION_MINUTES:
+            if remaining <= room:
+                length = remaining
+            elif remaining - self.MIN_SESSION_MINUTES >= self.MIN_SESSION_MINUTES:
+                length = remaining - self.MIN_SESSION_MINUTES
+            else:
+                return 0
+        return length if length >= min(self.MIN_SESSION_MINUTES, remaining) else 0
+
+    @staticmethod
+    def _free_intervals(blocks: List[tuple], wake: int, sleep: int) -> List[tuple]:
+        free = []
+        cursor = wake
+        for start, end, _, _ in sorted(blocks):
+            if start > cursor:
+                free.append((cursor, start))
+            cursor = max(cursor, end)
+        if cursor < sleep:
+            free.append((cursor, sleep))
+        return free
+
+    def _study_minutes(self, preferences: StudentPreferences) -> Dict[str, int]:
+        """Split the daily study time across subjects in proportion to their course load.
+
+        A subject whose share is below one minimum session gets a full one,
+        taken from the heaviest subject, or is folded into the heaviest
+        subject when that would leave it below a session itself.
+        """
+        total = preferences.study_hours * 60
+        load = sum(hours for hours in preferences.course_load.values() if hours > 0)
+        if not total:
+            return {}
+        if not load:
+            return {"General study": total}
+        minutes = {
+            subject: round(total * hours / load)
+            for subject, hours in preferences.course_load.items() if hours > 0
+        }
+        heaviest = max(minutes, key=minutes.get)
+        for subject in sorted(minutes, key=minutes.get, reverse=True):
+            if subject == heaviest or minutes[subject] >= self.MIN_SESSION_MINUTES:
+                continue
+            extra = self.MIN_SESSION_MINUTES - minutes[subject]
+            if minutes[heaviest] - extra >= self.MIN_SESSION_MINUTES:
+                minutes[heaviest] -= extra
+                minutes[subject] = self.MIN_SESSION_MINUTES
+            else:
+                minutes[heaviest] += minutes[subject]
+                minutes[subject] = 0
+        return {subject: value for subject, value in minutes.items() if value > 0}
+
+    def _slot_of(self, minutes: int) -> Optional[TimeSlot]:
+        hour = (minutes // 60) % 24
+        for slot, (start, end) in self.time_slots.items():
+            if start <= hour < end:
+                return slot
+        return None
+
+    def _energy_level(self, minutes: int, preferences: StudentPreferences) -> int:
+        slot = self._slot_of(minutes)
+        if preferences.energy_patterns and slot is not None:
+            for name, level in preferences.energy_patterns.items():
+                if name in slot.value:
+                    return level
+        return 8 if slot == preferences.productivity_peak else 6
+
+    def _preference(self, interval: tuple, preferences: StudentPreferences) -> tuple:
+        """Sort key for free intervals: peak slot first, then by energy, then chronological."""
+        slot = self._slot_of(interval[0])
+        return (slot != preferences.productivity_peak, -self._energy_level(interval[0], preferences), interval[0])
+
 class RoutineAssistant:
-    def __init__(self):
+    def __init__(self, gateway: OllamaGateway = None):
         self.model = 'llama3.2'
-        self.client = AsyncClient()
+        # Requests go through a gateway (pooled client, concurrency limit, cache) shared with the other assistants
+        self.gateway = gateway or OllamaGateway()
+        self.instructions = self._static_instructions()
         self.time_slots = {
             TimeSlot.EARLY_MORNING: (5, 8),
             TimeSlot.MORNING: (8, 12),
@@ -49,14 +257,54 @@ class RoutineAssistant:
             TimeSlot.NIGHT: (20, 23)
         }
 
-    async def generate_personalized_routine(self, preferences: StudentPreferences) -> Dict:
-        """Generate a personalized routine using LLM analysis."""
-        prompt = self._construct_prompt(preferences)
-        routine = await self._analyze_with_llm(prompt)
+    async def generate_personalized_routine(self, preferences: StudentPreferences, use_cache: bool = True) -> Dict:
+        """Generate a personalized routine.
+
+        The timetable is built locally by ScheduleEngine; the LLM only adds
+        per-block details and tips and the wellness sections, in one call.
+        If that call fails the timetable is still returned.
+        """
+        schedule = ScheduleEngine(self.time_slots).build(preferences)
+        prompt = self._construct_prompt(preferences, schedule["schedule_blocks"])
+        enrichment = await self._analyze_with_llm(prompt, use_cache)
+        routine = self._merge_enrichment(schedule, enrichment)
         return self._post_process_routine(routine, preferences)
 
-    def _construct_prompt(self, preferences: StudentPreferences) -> str:
-        """Construct a detailed prompt for the LLM."""
+    async def generate_routines_batch(
+        self,
+        preferences_list: List[StudentPreferences],
+        concurrency: int = 4,
+        use_cache: bool = True
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Generate routines for many students, yielding each as soon as it is ready.
+
+        At most ``concurrency`` routines are generated at once. Yields
+        ``{"index": i, "routine": {...}}`` in completion order, where ``i``
+        is the position in ``preferences_list``. Every request shares the
+        same system message, so Ollama evaluates the static instructions once
+        per loaded model slot rather than once per student.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def generate(index: int, preferences: StudentPreferences) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    routine = await self.generate_personalized_routine(preferences, use_cache)
+                except Exception as e:
+                    routine = {"error": str(e)}
+                return {"index": index, "routine": routine}
+
+        tasks = [asyncio.create_task(generate(i, p)) for i, p in enumerate(preferences_list)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            # The consumer went away (e.g. the client disconnected); stop the remaining work
+            for task in tasks:
+                task.cancel()
+
+    def _construct_prompt(self, preferences: StudentPreferences, blocks: List[Dict]) -> str:
+        """Construct the student-specific part of the prompt."""
         student_profile = (
             f"STUDENT PROFILE:\n"
             f"Wake-up Time: {preferences.wake_up_time}\n"
@@ -70,43 +318,53 @@ class RoutineAssistant:
 
         course_details = self._format_course_load(preferences.course_load)
         special_needs = self._format_special_requirements(preferences)
+        schedule = self._format_schedule(blocks)
+
+        return (
+            f"{student_profile}\n"
+            f"COURSE LOAD AND REQUIREMENTS:\n{course_details}\n\n"
+            f"SPECIAL CONSIDERATIONS:\n{special_needs}\n\n"
+            f"PLANNED SCHEDULE:\n{schedule}\n"
+        )
+
+    def _static_instructions(self) -> str:
+        """Instructions shared by every student, sent as an identical system message.
 
+        Keeping them byte-identical and first lets Ollama reuse the evaluated
+        prefix from its prompt cache instead of prefilling it for every student.
+        """
         output_requirements = (
             "\nREQUIRED OUTPUT FORMAT:\n"
             "{\n"
-            "    \"daily_routine\": {\n"
-            "        \"schedule_blocks\": [\n"
-            "            {\n"
-            "                \"time_slot\": \"HH:MM-HH:MM\",\n"
-            "                \"activity\": \"Activity name\",\n"
-            "                \"type\": \"ActivityType\",\n"
-            "                \"energy_level\": 1-10,\n"
-            "                \"details\": [\"detail1\", \"detail2\"],\n"
-            "                \"optimization_tips\": [\"tip1\", \"tip2\"],\n"
-            "                \"alternatives\": [\"alt1\", \"alt2\"]\n"
-            "            }\n"
-            "        ],\n"
-            "        \"wellness_recommendations\": {\n"
-            "            \"stress_management\": [\"recommendation1\", \"recommendation2\"],\n"
-            "            \"energy_optimization\": [\"tip1\", \"tip2\"],\n"
-            "            \"work_life_balance\": [\"suggestion1\", \"suggestion2\"]\n"
-            "        },\n"
-            "        \"adaptation_strategies\": {\n"
-            "            \"low_energy_days\": [\"strategy1\", \"strategy2\"],\n"
-            "            \"high_stress_periods\": [\"strategy1\", \"strategy2\"],\n"
-            "            \"unexpected_changes\": [\"strategy1\", \"strategy2\"]\n"
-            "        },\n"
-            "        \"success_metrics\": {\n"
-            "            \"daily_goals\": [\"goal1\", \"goal2\"],\n"
-            "            \"progress_indicators\": [\"indicator1\", \"indicator2\"],\n"
-            "            \"adjustment_triggers\": [\"trigger1\", \"trigger2\"]\n"
+            "    \"blocks\": [\n"
+            "        {\n"
+            "            \"index\": 0,\n"
+            "            \"details\": [\"detail1\", \"detail2\"],\n"
+            "            \"optimization_tips\": [\"tip1\", \"tip2\"],\n"
+            "            \"alternatives\": [\"alt1\", \"alt2\"]\n"
             "        }\n"
+            "    ],\n"
+            "    \"wellness_recommendations\": {\n"
+            "        \"stress_management\": [\"recommendation1\", \"recommendation2\"],\n"
+            "        \"energy_optimization\": [\"tip1\", \"tip2\"],\n"
+            "        \"work_life_balance\": [\"suggestion1\", \"suggestion2\"]\n"
+            "    },\n"
+            "    \"adaptation_strategies\": {\n"
+            "        \"low_energy_days\": [\"strategy1\", \"strategy2\"],\n"
+            "        \"high_stress_periods\": [\"strategy1\", \"strategy2\"],\n"
+            "        \"unexpected_changes\": [\"strategy1\", \"strategy2\"]\n"
+            "    },\n"
+            "    \"success_metrics\": {\n"
+            "        \"daily_goals\": [\"goal1\", \"goal2\"],\n"
+            "        \"progress_indicators\": [\"indicator1\", \"indicator2\"],\n"
+            "        \"adjustment_triggers\": [\"trigger1\", \"trigger2\"]\n"
             "    }\n"
             "}\n"
         )
 
         optimization_requirements = (
             "\nOPTIMIZATION REQUIREMENTS:\n"
+            "0. The schedule is fixed: do not change, add or remove blocks; only describe them by index\n"
             "1. Maximize productivity during peak hours\n"
             "2. Balance study and breaks effectively\n"
             "3. Account for energy patterns throughout the day\n"
@@ -117,16 +375,44 @@ class RoutineAssistant:
         )
 
         return (
-            "You are an experienced academic coach and wellness expert creating a personalized "
-            "daily routine for a student. Your goal is to optimize their schedule for both "
-            "academic success and overall well-being.\n\n"
-            f"{student_profile}\n"
-            f"COURSE LOAD AND REQUIREMENTS:\n{course_details}\n\n"
-            f"SPECIAL CONSIDERATIONS:\n{special_needs}\n\n"
+            "You are an experienced academic coach and wellness expert completing a personalized "
+            "daily routine for a student. Their timetable is already planned; your goal is to make it "
+            "work for both academic success and overall well-being. The student's profile and "
+            "planned schedule follow in the next message.\n"
             f"{output_requirements}\n"
             f"{optimization_requirements}\n"
         )
 
+    def _format_schedule(self, blocks: List[Dict]) -> str:
+        """List the blocks worth describing; breaks and sleep are left out to keep the reply short."""
+        return "\n".join(
+            f"[{index}] {block['time_slot']} {block['activity']} ({block['type']})"
+            for index, block in enumerate(blocks)
+            if block["type"] not in (ActivityType.BREAK.value, ActivityType.SLEEP.value)
+        )
+
+    def _merge_enrichment(self, schedule: Dict, enrichment: Dict) -> Dict:
+        """Attach the LLM's per-block text and wellness sections to the computed schedule."""
+        blocks = schedule["schedule_blocks"]
+        for item in enrichment.get("blocks", []):
+            if not isinstance(item, dict):
+                continue
+            try:
+                block = blocks[int(item.get("index"))]
+            except (TypeError, ValueError, IndexError):
+                continue
+            for field in ("details", "optimization_tips", "alternatives"):
+                if isinstance(item.get(field), list):
+                    block[field] = item[field]
+
+        daily_routine = {"schedule_blocks": blocks}
+        for section in ROUTINE_SECTIONS[1:]:
+            daily_routine[section] = enrichment.get(section, {})
+        routine = {"daily_routine": daily_routine, "unscheduled_study_minutes": schedule["unscheduled_study_minutes"]}
+        if "error" in enrichment:
+            routine["enrichment_error"] = enrichment["error"]
+        return routine
+
     def _format_course_load(self, course_load: Dict[str, int]) -> str:
         """Format course load information for the prompt."""
         formatted = []
@@ -159,15 +445,16 @@ class RoutineAssistant:
             
         return "\n".join(requirements) if requirements else "No special requirements specified"
 
-    async def _analyze_with_llm(self, prompt: str) -> Dict:
-        """Generate personalized routine using LLM asynchronously."""
+    async def _analyze_with_llm(self, prompt: str, use_cache: bool = True) -> Dict:
+        """Describe the planned blocks and write the wellness sections using LLM asynchronously."""
         try:
-            response = await self.client.chat(
+            return await self.gateway.chat_json(
                 model=self.model,
-                messages=[{'role': 'user', 'content': prompt}],
-                format='json'
+                prompt=prompt,
+                sections=ROUTINE_SECTIONS,
+                use_cache=use_cache,
+                system=self.instructions
             )
-            return json.loads(response['message']['content'])
         except json.JSONDecodeError as e:
             print(f"Error parsing LLM response: {e}")
             return {"error": "Failed to generate valid routine"}
@@ -176,7 +463,7 @@ class RoutineAssistant:
             return {"error": str(e)}
 
     def _post_process_routine(self, routine: Dict, preferences: StudentPreferences) -> Dict:
-        """Post-process and validate the LLM-generated routine."""
+        """Post-process and validate the generated routine."""
         if "error" in routine:
             return routine
 
@@ -184,12 +471,15 @@ class RoutineAssistant:
             "metadata": {
                 "generated_at": datetime.now().isoformat(),
                 "student_preferences": self._serialize_preferences(preferences),
-                "version": "1.0"
+                "unscheduled_study_minutes": routine["unscheduled_study_minutes"],
+                "version": "1.1"
             },
             "routine": routine["daily_routine"],
             # "analytics": self._generate_analytics(routine["daily_routine"]),
             "implementation_guide": self._create_implementation_guide(routine["daily_routine"])
         }
+        if "enrichment_error" in routine:
+            processed_routine["metadata"]["enrichment_error"] = routine["enrichment_error"]
 
         return processed_routine
 
@@ -0,0 +1,341 @@
+import heapq
+import json
+import math
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from segmentStore import parse_transcript
+
+MANIFEST_NAME = "index.json"
+
+# Words too common in lectures to rank anything
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "if", "in", "into", "is", "it",
+    "of", "on", "or", "so", "that", "the", "then", "there", "this", "to", "was", "we", "with", "you",
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Per-document fields stored in an index segment
+DOC_DTYPE = np.dtype([("lecture", "<u4"), ("start", "<f4"), ("end", "<f4"), ("length", "<u4")])
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class IndexSegment:
+    """One immutable piece of the index, stored as a directory of flat arrays.
+
+    ``docs.npy``, the postings and the text offsets are memory-mapped; only
+    the term dictionary (term -> postings offset and count) and the
+    lecture list are held in memory.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path / "meta.json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.lectures: List[str] = meta["lectures"]
+        self.lecture_ordinals = {lecture_id: i for i, lecture_id in enumerate(self.lectures)}
+        self.doc_count: int = meta["doc_count"]
+        self.total_length: int = meta["total_length"]
+        self.terms: Dict[str, Tuple[int, int]] = {term: tuple(entry) for term, entry in meta["terms"].items()}
+        self.docs = np.load(self.path / "docs.npy", mmap_mode='r')
+        self.postings_docs = np.load(self.path / "postings_docs.npy", mmap_mode='r')
+        self.postings_tf = np.load(self.path / "postings_tf.npy", mmap_mode='r')
+        self.text_offsets = np.load(self.path / "text_offsets.npy", mmap_mode='r')
+        self._text = np.memmap(self.path / "text.bin", dtype=np.uint8, mode='r') if self.text_offsets[-1] else None
+
+    def __len__(self) -> int:
+        return self.doc_count
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        offset, count = self.terms.get(term, (0, 0))
+        return self.postings_docs[offset:offset + count], self.postings_tf[offset:offset + count]
+
+    def text(self, doc: int) -> str:
+        if self._text is None:
+            return ""
+        begin, end = int(self.text_offsets[doc]), int(self.text_offsets[doc + 1])
+        return self._text[begin:end].tobytes().decode('utf-8')
+
+    def documents(self, skip_lectures: Set[str] = frozenset()) -> Iterable[Tuple[str, float, float, str]]:
+        """Yield ``(lecture_id, start, end, text)`` for every document not in ``skip_lectures``."""
+        for doc, (lecture, start, end, _) in enumerate(self.docs):
+            lecture_id = self.lectures[lecture]
+            if lecture_id not in skip_lectures:
+                yield lecture_id, float(start), float(end), self.text(doc)
+
+    @staticmethod
+    def write(
+        path: Path, documents: Iterable[Tuple[str, float, float, str]], lectures: Iterable[str] = ()
+    ) -> "IndexSegment":
+        """Build a segment from ``(lecture_id, start, end, text)`` documents.
+
+        ``lectures`` are recorded as indexed even when they have no documents.
+        """
+        ordinals: Dict[str, int] = {lecture_id: i for i, lecture_id in enumerate(dict.fromkeys(lectures))}
+        rows = []
+        texts = []
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc, (lecture_id, start, end, text) in enumerate(documents):
+            tokens = tokenize(text)
+            rows.append((ordinals.setdefault(lecture_id, len(ordinals)), start, end, len(tokens)))
+            texts.append(text.encode('utf-8'))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc, min(tf, 65535)))
+
+        terms = {}
+        postings_docs = []
+        postings_tf = []
+        offset = 0
+        for term in sorted(postings):
+            entries = postings[term]
+            terms[term] = (offset, len(entries))
+            postings_docs.extend(doc for doc, _ in entries)
+            postings_tf.extend(tf for _, tf in entries)
+            offset += len(entries)
+
+        text_offsets = np.zeros(len(texts) + 1, dtype='<u8')
+        text_offsets[1:] = np.cumsum([len(text) for text in texts])
+
+        # Written under a temporary name and renamed, so a crash never leaves half a segment
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+        np.save(tmp_path / "docs.npy", np.array(rows, dtype=DOC_DTYPE))
+        np.save(tmp_path / "postings_docs.npy", np.array(postings_docs, dtype='<u4'))
+        np.save(tmp_path / "postings_tf.npy", np.array(postings_tf, dtype='<u2'))
+        np.save(tmp_path / "text_offsets.npy", text_offsets)
+        with open(tmp_path / "text.bin", 'wb') as f:
+            f.write(b"".join(texts))
+        with open(tmp_path / "meta.json", 'w', encoding='utf-8') as f:
+            json.dump({
+                "lectures": list(ordinals),
+                "doc_count": len(rows),
+                "total_length": sum(row[3] for row in rows),
+                "terms": terms,
+            }, f)
+        tmp_path.rename(path)
+        return IndexSegment(path)
+
+
+class SearchIndex:
+    """BM25 full-text index over transcript segments of every lecture.
+
+    Each indexed lecture is written as a new small segment. Segments are
+    grouped into size tiers (powers of ``merge_factor`` documents), and once
+    a tier holds ``merge_factor`` segments they are merged into one of the
+    next tier. The number of files and in-memory term dictionaries therefore
+    grows only logarithmically, and every document is rewritten once per tier
+    (log-structured, as in Lucene). Re-indexing a lecture masks its
+    old documents until the next merge drops them. ``index.json`` lists
+    the live segments and is replaced atomically.
+    """
+
+    def __init__(self, base_dir: str = "media_storage", merge_factor: int = 8, k1: float = 1.2, b: float = 0.75):
+        self.index_dir = Path(base_dir) / "search_index"
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.merge_factor = merge_factor
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+
+        manifest_path = self.index_dir / MANIFEST_NAME
+        manifest = {"next_segment": 0, "segments": [], "deleted": {}}
+        if manifest_path.exists():
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        self._next_segment = manifest["next_segment"]
+        # Segment name -> lecture IDs whose documents in it have been superseded
+        self._deleted: Dict[str, Set[str]] = {name: set(ids) for name, ids in manifest["deleted"].items()}
+        self._segments: Dict[str, IndexSegment] = {
+            name: IndexSegment(self.index_dir / name) for name in manifest["segments"]
+        }
+        self._lectures: Dict[str, str] = {
+            lecture_id: name
+            for name, segment in self._segments.items()
+            for lecture_id in segment.lectures
+            if lecture_id not in self._deleted.get(name, ())
+        }
+        self._remove_orphans()
+
+    def add_lecture(self, lecture_id: str, segments: List[Dict[str, Any]]) -> None:
+        """Index (or re-index) the transcript segments of one lecture."""
+        documents = [
+            (lecture_id, float(segment['start']), float(segment['end']), segment['text'].strip())
+            for segment in segments if segment['text'].strip()
+        ]
+        with self._lock:
+            name = self._new_segment_name()
+            segment = IndexSegment.write(self.index_dir / name, documents, lectures=[lecture_id])
+            previous = self._lectures.get(lecture_id)
+            if previous is not None:
+                self._deleted.setdefault(previous, set()).add(lecture_id)
+            self._segments[name] = segment
+            self._lectures[lecture_id] = name
+            self._save_manifest()
+
+            self._merge_tiers()
+
+    def index_transcripts(self, transcription_dir: Path) -> int:
+        """Index every ``*_transcript.txt`` in ``transcription_dir`` that is not indexed yet."""
+        added = 0
+        for transcript_path in sorted(Path(transcription_dir).glob("*_transcript.txt")):
+            lecture_id = transcript_path.name[:-len("_transcript.txt")]
+            if lecture_id not in self._lectures:
+                self.add_lecture(lecture_id, parse_transcript(transcript_path))
+                added += 1
+        return added
+
+    def search(self, query: str, limit: int = 10, lecture_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return the ``limit`` best matching segments, optionally within one lecture."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            segments = list(self._segments.items())
+            deleted = {name: set(ids) for name, ids in self._deleted.items()}
+        if not terms or not segments:
+            return []
+
+        # Corpus statistics span all segments so scores are comparable between them
+        doc_count = sum(len(segment) for _, segment in segments) or 1
+        avg_length = sum(segment.total_length for _, segment in segments) / doc_count or 1.0
+        idf = {}
+        for term in terms:
+            df = sum(segment.terms.get(term, (0, 0))[1] for _, segment in segments)
+            idf[term] = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+
+        # Only the postings of the query terms are touched, so a query costs O(matching postings)
+        candidates = []
+        for name, segment in segments:
+            wanted = None
+            if lecture_id is not None:
+                wanted = segment.lecture_ordinals.get(lecture_id)
+                if wanted is None or lecture_id in deleted.get(name, ()):
+                    continue
+            masked = [
+                segment.lecture_ordinals[lecture]
+                for lecture in deleted.get(name, ()) if lecture in segment.lecture_ordinals
+            ]
+
+            doc_parts, score_parts = [], []
+            for term in terms:
+                docs, tf = segment.postings(term)
+                if not len(docs):
+                    continue
+                tf = tf.astype(np.float32)
+                norm = self.k1 * (1 - self.b + self.b * segment.docs["length"][docs] / avg_length)
+                doc_parts.append(docs)
+                score_parts.append(idf[term] * tf * (self.k1 + 1) / (tf + norm))
+            if not doc_parts:
+                continue
+
+            docs, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+            if wanted is not None or masked:
+                lectures = segment.docs["lecture"][docs]
+                keep = lectures == wanted if wanted is not None else ~np.isin(lectures, masked)
+                docs, scores = docs[keep], scores[keep]
+            if len(docs) > limit:
+                top = np.argpartition(-scores, limit)[:limit]
+                docs, scores = docs[top], scores[top]
+            candidates.extend((float(score), name, int(doc)) for doc, score in zip(docs, scores))
+
+        results = []
+        segments_by_name = dict(segments)
+        for score, name, doc in heapq.nlargest(limit, candidates):
+            segment = segments_by_name[name]
+            lecture, start, end, _ = segment.docs[doc]
+            results.append({
+                "lecture_id": segment.lectures[lecture],
+                "start": round(float(start), 2),
+                "end": round(float(end), 2),
+                "text": segment.text(doc),
+                "score": round(score, 4),
+            })
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "lectures": len(self._lectures),
+                "segments": len(self._segments),
+                "documents": sum(len(segment) for segment in self._segments.values()),
+                "terms": sum(len(segment.terms) for segment in self._segments.values()),
+            }
+
+    def _merge_tiers(self) -> None:
+        """Merge ``merge_factor`` segments of the smallest full size tier until no tier is full."""
+        while True:
+            tiers: Dict[int, List[str]] = {}
+            for name, segment in self._segments.items():
+                tier = int(math.log(max(len(segment), 1), self.merge_factor))
+                tiers.setdefault(tier, []).append(name)
+            full = [names for _, names in sorted(tiers.items()) if len(names) >= self.merge_factor]
+            if not full:
+                return
+            self._merge(full[0][:self.merge_factor])
+
+    def _merge(self, names: List[str]) -> None:
+        """Merge the segments ``names`` into one, dropping superseded documents."""
+        start_time = time.perf_counter()
+        documents = [
+            document
+            for name in sorted(names, key=lambda name: int(name.split("_")[1]))
+            for document in self._segments[name].documents(self._deleted.get(name, set()))
+        ]
+        lectures = [
+            lecture_id
+            for name in names
+            for lecture_id in self._segments[name].lectures
+            if lecture_id not in self._deleted.get(name, ())
+        ]
+        merged_name = self._new_segment_name()
+        merged = IndexSegment.write(self.index_dir / merged_name, documents, lectures=lectures)
+
+        for name in names:
+            del self._segments[name]
+            self._deleted.pop(name, None)
+        self._segments[merged_name] = merged
+        for lecture_id in merged.lectures:
+            self._lectures[lecture_id] = merged_name
+        self._save_manifest()
+
+        # Searches that already hold the old segments keep reading their (unlinked) mappings
+        for name in names:
+            shutil.rmtree(self.index_dir / name, ignore_errors=True)
+        print(
+            f"Merged {len(names)} search index segments ({len(merged)} documents) "
+            f"in {time.perf_counter() - start_time:.2f}s"
+        )
+
+    def _new_segment_name(self) -> str:
+        name = f"seg_{self._next_segment:06d}"
+        self._next_segment += 1
+        return name
+
+    def _save_manifest(self) -> None:
+        manifest = {
+            "next_segment": self._next_segment,
+            "segments": sorted(self._segments),
+            "deleted": {name: sorted(ids) for name, ids in self._deleted.items() if name in self._segments},
+        }
+        manifest_path = self.index_dir / MANIFEST_NAME
+        tmp_path = manifest_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        tmp_path.replace(manifest_path)
+
+    def _remove_orphans(self) -> None:
+        """Delete segment directories left behind by an interrupted write or merge."""
+        for path in self.index_dir.iterdir():
+            if path.is_dir() and path.name not in self._segments:
+                shutil.rmtree(path, ignore_errors=True)
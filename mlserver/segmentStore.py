@@ -0,0 +1,129 @@
+import mmap
+import re
+import struct
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Layout: header | starts (float32[n]) | ends (float32[n]) | offsets (uint64[n + 1]) | UTF-8 text
+MAGIC = b"SEGS"
+VERSION = 1
+_HEADER = struct.Struct("<4sII4x")
+SUFFIX = ".segments"
+
+_LINE = re.compile(r"^\[(\d+(?:\.\d+)?)s -> (\d+(?:\.\d+)?)s\] ?(.*)$")
+
+
+def segments_path(transcript_path: Path) -> Path:
+    """The segment file kept next to a ``*_transcript.txt`` file."""
+    return Path(transcript_path).with_suffix(SUFFIX)
+
+
+def write_segments(path: Path, segments: Iterable[Dict[str, Any]]) -> Path:
+    """Write segments (``start``, ``end``, ``text``) sorted by start time."""
+    segments = sorted(segments, key=lambda segment: segment['start'])
+    texts = [segment['text'].strip().encode('utf-8') for segment in segments]
+    starts = np.array([segment['start'] for segment in segments], dtype='<f4')
+    ends = np.array([segment['end'] for segment in segments], dtype='<f4')
+    offsets = np.zeros(len(segments) + 1, dtype='<u8')
+    offsets[1:] = np.cumsum([len(text) for text in texts])
+
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(segments)))
+        f.write(starts.tobytes())
+        f.write(ends.tobytes())
+        f.write(offsets.tobytes())
+        f.write(b"".join(texts))
+    tmp_path.replace(path)
+    return path
+
+
+def parse_transcript(transcript_path: Path) -> List[Dict[str, Any]]:
+    """Read segments back from a ``[start -> end] text`` transcript file."""
+    segments = []
+    with open(transcript_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            match = _LINE.match(line.rstrip('\n'))
+            if match:
+                segments.append({
+                    "start": float(match.group(1)),
+                    "end": float(match.group(2)),
+                    "text": match.group(3),
+                })
+    return segments
+
+
+class SegmentStore:
+    """Read-only, memory-mapped view of a segment file.
+
+    Only the header is parsed on open; time arrays are NumPy views on the
+    mapping and text is decoded per returned segment, so a range query on
+    a long lecture touches a few pages rather than the whole file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"Not a segment file (version {VERSION}): {self.path}")
+
+        position = _HEADER.size
+        self.starts = np.frombuffer(self._mmap, dtype='<f4', count=count, offset=position)
+        position += 4 * count
+        self.ends = np.frombuffer(self._mmap, dtype='<f4', count=count, offset=position)
+        position += 4 * count
+        self.offsets = np.frombuffer(self._mmap, dtype='<u8', count=count + 1, offset=position)
+        self._text_start = position + 8 * (count + 1)
+
+    @classmethod
+    def for_transcript(cls, transcript_path: Path) -> "SegmentStore":
+        """Open the segment file of a transcript, building it from the text file if missing."""
+        path = segments_path(transcript_path)
+        if not path.exists():
+            write_segments(path, parse_transcript(transcript_path))
+        return cls(path)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __enter__(self) -> "SegmentStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        # The NumPy views must go before the mapping can be closed
+        self.starts = self.ends = self.offsets = None
+        self._mmap.close()
+
+    @property
+    def duration(self) -> float:
+        return float(self.ends.max()) if len(self) else 0.0
+
+    def segment(self, index: int) -> Dict[str, Any]:
+        begin = self._text_start + int(self.offsets[index])
+        end = self._text_start + int(self.offsets[index + 1])
+        return {
+            "start": round(float(self.starts[index]), 3),
+            "end": round(float(self.ends[index]), 3),
+            "text": self._mmap[begin:end].decode('utf-8'),
+        }
+
+    def query(self, start: Optional[float] = None, end: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Segments overlapping ``[start, end)`` seconds; either bound may be omitted."""
+        low = 0
+        if start is not None:
+            # Segments do not overlap, so only the one before the first later start can still run into the range
+            low = max(int(np.searchsorted(self.starts, start, side='right')) - 1, 0)
+            while low < len(self) and self.ends[low] <= start:
+                low += 1
+        high = len(self) if end is None else int(np.searchsorted(self.starts, end, side='left'))
+        return [self.segment(index) for index in range(low, high)]
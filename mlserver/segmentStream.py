@@ -0,0 +1,93 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+
+class _Channel:
+    def __init__(self):
+        self.history: List[Dict[str, Any]] = []
+        self.subscribers: List[asyncio.Queue] = []
+        self.closed = False
+        self.closed_at: Optional[float] = None
+
+
+class SegmentBroker:
+    """Fan transcript segments out to live subscribers while a task is running.
+
+    Every channel keeps the segments published so far, so a client that
+    connects late first receives the backlog and then follows live. Closed
+    channels are dropped ``retention_seconds`` after the task finished; from
+    then on clients should read ``/transcript`` instead.
+    """
+
+    def __init__(self, retention_seconds: float = 300):
+        self.retention_seconds = retention_seconds
+        self._channels: Dict[str, _Channel] = {}
+
+    def open(self, task_id: str) -> None:
+        self._prune()
+        self._channels.setdefault(task_id, _Channel())
+
+    def has_channel(self, task_id: str) -> bool:
+        return task_id in self._channels
+
+    def publisher(self, task_id: str):
+        """Return a callback that publishes a batch of segments to ``task_id``."""
+        async def publish(segments: List[Dict[str, Any]]):
+            self.publish(task_id, segments)
+        return publish
+
+    def publish(self, task_id: str, segments: List[Dict[str, Any]]) -> None:
+        channel = self._channels.get(task_id)
+        if channel is None or channel.closed:
+            return
+        payload = [
+            {"id": s["id"], "start": s["start"], "end": s["end"], "text": s["text"].strip()}
+            for s in segments
+        ]
+        channel.history.extend(payload)
+        for queue in channel.subscribers:
+            for item in payload:
+                queue.put_nowait(item)
+
+    def close(self, task_id: str) -> None:
+        channel = self._channels.get(task_id)
+        if channel is None or channel.closed:
+            return
+        channel.closed = True
+        channel.closed_at = time.time()
+        for queue in channel.subscribers:
+            queue.put_nowait(None)
+
+    async def subscribe(self, task_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Yield every segment of ``task_id``: the backlog first, then live ones until close."""
+        channel = self._channels.get(task_id)
+        if channel is None:
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in channel.history:
+            queue.put_nowait(item)
+        if channel.closed:
+            queue.put_nowait(None)
+        else:
+            channel.subscribers.append(queue)
+
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                yield item
+        finally:
+            if queue in channel.subscribers:
+                channel.subscribers.remove(queue)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention_seconds
+        expired = [
+            task_id for task_id, channel in self._channels.items()
+            if channel.closed and not channel.subscribers and channel.closed_at < cutoff
+        ]
+        for task_id in expired:
+            del self._channels[task_id]
@@ -1,19 +1,44 @@
-from fastapi import FastAPI, UploadFile, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, UploadFile, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from pathlib import Path
 import asyncio
-import shutil
+import json
+import os
+import re
+import time
 import uuid
 from typing import Dict, List
 from typing import Dict, Optional
 from pydantic import BaseModel
 from lectures import MediaProcessor
 from examPrepAssistant import ExamPrepAssistant
+from routine import RoutineAssistant, StudentPreferences, TimeSlot
+from taskStore import TaskStore
+from workers import JobScheduler, WhisperPool
+from batching import WhisperBatcher
+from modelRegistry import AVAILABLE_MODELS
+from uploads import RequestSizeLimitMiddleware, save_upload
+from segmentStream import SegmentBroker
+from keyframeIndex import KeyframeIndex
+from segmentStore import SegmentStore
+from searchIndex import SearchIndex
+from ffmpegRunner import describe_error
+import ffmpeg
+from llmCache import LLMCache
+from ollamaGateway import OllamaGateway
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
 
 app = FastAPI(title="Media Processing API")
 
+# Uploads are streamed to disk in chunks and rejected once they pass these limits
+MAX_VIDEO_BYTES = int(os.environ.get("MAX_VIDEO_BYTES", 4 * 1024 ** 3))
+MAX_DOCUMENT_BYTES = int(os.environ.get("MAX_DOCUMENT_BYTES", 20 * 1024 ** 2))
+# Whole request bodies are capped while they arrive, before FastAPI spools the files to disk;
+# the largest request is a video plus an analysis file, with headroom for the multipart framing.
+# Registered before CORS so CORS stays the outer layer and adds its headers to the 413.
+app.add_middleware(RequestSizeLimitMiddleware, max_bytes=MAX_VIDEO_BYTES + MAX_DOCUMENT_BYTES + 1024 ** 2)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # List of origins that are allowed to make requests
@@ -22,8 +47,8 @@ app.add_middleware(
     allow_headers=["*"],  # Allowed headers
 )
 
-# Store active processing tasks
-active_tasks: Dict[str, dict] = {}
+# Task status rows are kept in SQLite and results on disk so they survive restarts
+task_store = TaskStore(base_dir="media_storage")
 
 class ProcessingResponse(BaseModel):
     task_id: str
@@ -59,83 +84,148 @@ class ExamPrepRequest(BaseModel):
     course_materials: List[Material]
     syllabus: Syllabus
 
+class RoutinePreferences(BaseModel):
+    wake_up_time: str
+    sleep_time: str
+    study_hours: int
+    exercise_preference: str
+    meal_times: List[str]
+    hobbies: List[str]
+    break_duration: int
+    productivity_peak: TimeSlot
+    course_load: Dict[str, int]
+    special_requirements: Optional[List[str]] = None
+    learning_style: Optional[str] = None
+    stress_level: Optional[int] = None
+    energy_patterns: Optional[Dict[str, int]] = None
+
+class RoutineBatchRequest(BaseModel):
+    students: List[RoutinePreferences]
+    concurrency: int = 4
+
+
+# Whisper runs in a fixed-size process pool fed by a priority queue of jobs
+WHISPER_WORKERS = int(os.environ.get("WHISPER_WORKERS", 2))
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "base")
+# Per-worker budget for loaded Whisper models, and models to load before the first request
+WHISPER_MEMORY_MB = int(os.environ.get("WHISPER_MEMORY_MB", 4096))
+WHISPER_WARMUP = [m for m in os.environ.get("WHISPER_WARMUP", "").split(",") if m]
+
+whisper_pool = WhisperPool(
+    num_workers=WHISPER_WORKERS,
+    model_name=WHISPER_MODEL,
+    memory_budget_mb=WHISPER_MEMORY_MB,
+    warm_up=WHISPER_WARMUP
+)
+scheduler = JobScheduler(task_store, num_workers=WHISPER_WORKERS)
+
+# Cross-job batching of 30s windows; a batch size of 0 or 1 keeps per-job transcription
+WHISPER_BATCH_SIZE = int(os.environ.get("WHISPER_BATCH_SIZE", 0))
+WHISPER_BATCH_WAIT_MS = float(os.environ.get("WHISPER_BATCH_WAIT_MS", 50))
+whisper_batcher = (
+    WhisperBatcher(whisper_pool, max_batch_size=WHISPER_BATCH_SIZE, max_wait_ms=WHISPER_BATCH_WAIT_MS)
+    if WHISPER_BATCH_SIZE > 1 else None
+)
 
-# Initialize MediaProcessor
-processor = MediaProcessor(base_dir="media_storage")
-prep_assistant = ExamPrepAssistant()
+# LLM responses are cached on disk and shared by every assistant
+LLM_CACHE_MAX_MB = int(os.environ.get("LLM_CACHE_MAX_MB", 256))
+LLM_CACHE_TTL_SECONDS = float(os.environ.get("LLM_CACHE_TTL_SECONDS", 7 * 86400))
+llm_cache = LLMCache(
+    base_dir="media_storage",
+    max_bytes=LLM_CACHE_MAX_MB * 1024 * 1024,
+    ttl_seconds=LLM_CACHE_TTL_SECONDS
+)
 
-async def process_video_task(task_id: str, file_path: Path):
-    try:
-        result = await processor.process_media(file_path)
-        active_tasks[task_id] = {
-            "status": "completed",
-            "result": result
-        }
-    except Exception as e:
-        active_tasks[task_id] = {
-            "status": "failed",
-            "error": str(e)
-        }
-    finally:
-        # Cleanup uploaded file
-        if file_path.exists():
-            file_path.unlink()
+# All Ollama requests share one pooled client and a cap on in-flight generations
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST")
+OLLAMA_MAX_CONCURRENCY = int(os.environ.get("OLLAMA_MAX_CONCURRENCY", 4))
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_WARMUP = [m for m in os.environ.get("OLLAMA_WARMUP", "llama3.2").split(",") if m]
+llm_gateway = OllamaGateway(
+    host=OLLAMA_HOST,
+    max_concurrency=OLLAMA_MAX_CONCURRENCY,
+    keep_alive=OLLAMA_KEEP_ALIVE,
+    cache=llm_cache
+)
 
-async def generate_transcript_task(task_id: str, file_path: Path):
-    try:
-        result = await processor.generate_transcript(file_path)
-        active_tasks[task_id] = {
-            "status": "completed",
-            "result": result
-        }
-    except Exception as e:
-        active_tasks[task_id] = {
-            "status": "failed",
-            "error": str(e)
-        }
-    finally:
-        if file_path.exists():
-            file_path.unlink()
+# Keyframes come from the LLM analysis ("llm"), slide changes ("scenes"), or the analysis
+# with slide changes as the fallback ("auto")
+KEYFRAME_MODE = os.environ.get("KEYFRAME_MODE", "auto")
+SLIDE_CHANGE_THRESHOLD = float(os.environ.get("SLIDE_CHANGE_THRESHOLD", 0.08))
+# Keyframes whose perceptual hashes differ by at most this many of 64 bits share one image;
+# an empty value disables deduplication
+KEYFRAME_DEDUP_THRESHOLD = os.environ.get("KEYFRAME_DEDUP_THRESHOLD", "6")
 
-async def generate_analysis_task(task_id: str, file_path: Path):
-    try:
-        result = await processor.analyze_transcript(file_path)
-        active_tasks[task_id] = {
-            "status": "completed",
-            "result": result
-        }
-    except Exception as e:
-        active_tasks[task_id] = {
-            "status": "failed",
-            "error": str(e)
-        }
-    finally:
-        if file_path.exists():
-            file_path.unlink()
+# Full-text index over every transcript, updated as transcriptions finish
+SEARCH_MERGE_FACTOR = int(os.environ.get("SEARCH_MERGE_FACTOR", 8))
+search_index = SearchIndex(base_dir="media_storage", merge_factor=SEARCH_MERGE_FACTOR)
+
+# Initialize MediaProcessor
+processor = MediaProcessor(
+    base_dir="media_storage",
+    whisper_pool=whisper_pool,
+    whisper_batcher=whisper_batcher,
+    llm_gateway=llm_gateway,
+    keyframe_mode=KEYFRAME_MODE,
+    slide_change_threshold=SLIDE_CHANGE_THRESHOLD,
+    keyframe_dedup_threshold=int(KEYFRAME_DEDUP_THRESHOLD) if KEYFRAME_DEDUP_THRESHOLD else None,
+    search_index=search_index
+)
+prep_assistant = ExamPrepAssistant(gateway=llm_gateway)
+routine_assistant = RoutineAssistant(gateway=llm_gateway)
+# Upper bound on the per-request concurrency of batch routine generation
+ROUTINE_BATCH_MAX_CONCURRENCY = int(os.environ.get("ROUTINE_BATCH_MAX_CONCURRENCY", 8))
+
+# Live transcript segments for running transcription jobs
+segment_broker = SegmentBroker()
+
+# Keyframe manifests cached in memory, resized/WebP variants cached on disk
+keyframe_index = KeyframeIndex()
+
+def _log_failure(description: str):
+    """Done-callback for background tasks that logs their exception instead of dropping it."""
+    def callback(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Warning: {description} failed: {task.exception()}")
+    return callback
+
+@app.on_event("startup")
+async def startup():
+    task_store.recover_interrupted()
+    await scheduler.start()
+    if WHISPER_WARMUP:
+        await whisper_pool.start()
+    # Load the LLM in the background so the first request does not pay the cold start
+    app.state.warmup_task = asyncio.create_task(llm_gateway.warm_up(OLLAMA_WARMUP))
+    app.state.warmup_task.add_done_callback(_log_failure("Ollama warm-up"))
+    # Transcripts written before the index existed (or while an update failed) are indexed in the background
+    app.state.index_task = asyncio.create_task(
+        asyncio.to_thread(search_index.index_transcripts, processor.transcription_dir)
+    )
+    app.state.index_task.add_done_callback(_log_failure("Indexing existing transcripts"))
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.warmup_task.cancel()
+    await scheduler.stop()
+    if whisper_batcher is not None:
+        await whisper_batcher.stop()
+    whisper_pool.shutdown()
 
-async def get_images_task(task_id: str, file_path: Path, analysis_path):
-    try:
-        result = await processor.extract_keyframes(file_path, analysis_path=analysis_path)
-        active_tasks[task_id] = {
-            "status": "completed",
-            "result": result
-        }
-    except Exception as e:
-        active_tasks[task_id] = {
-            "status": "failed",
-            "error": str(e)
-        }
-    finally:
-        if file_path.exists():
-            file_path.unlink()
+
+def _validate_whisper_model(whisper_model: Optional[str]):
+    if whisper_model is not None and whisper_model not in AVAILABLE_MODELS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown Whisper model '{whisper_model}'. Available: {', '.join(AVAILABLE_MODELS)}"
+        )
 
 @app.post("/generate-transcript", response_model=ProcessingResponse)
-async def genereate_transcript(
-    background_tasks: BackgroundTasks,
-    file: UploadFile
-):
+async def genereate_transcript(file: UploadFile, whisper_model: Optional[str] = None, stream: bool = False):
+    """``stream=true`` splits the audio so /transcript/{task_id}/stream gets its first segments early."""
     if not file.filename.endswith('.mp4'):
         raise HTTPException(status_code=400, detail="Only MP4 files are supported")
+    _validate_whisper_model(whisper_model)
 
     # Create unique task ID
     task_id = str(uuid.uuid4())
@@ -145,25 +235,32 @@ async def genereate_transcript(
     file_path.parent.mkdir(parents=True, exist_ok=True)
     
     try:
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        upload = await save_upload(file, file_path, max_bytes=MAX_VIDEO_BYTES)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
 
     # Initialize task status
-    active_tasks[task_id] = {"status": "processing"}
+    task_store.create(task_id, "transcript")
     
-    # Start processing in background
-    background_tasks.add_task(generate_transcript_task, task_id, file_path)
+    # Queue the job for the worker pool
+    segment_broker.open(task_id)
+    scheduler.submit(
+        task_id, "transcript", processor.generate_transcript, file_path,
+        media_hash=upload.sha256, model_name=whisper_model, on_segments=segment_broker.publisher(task_id),
+        stream=stream,
+        cleanup=[file_path], on_finish=lambda: segment_broker.close(task_id)
+    )
 
     return ProcessingResponse(
         task_id=task_id,
         status="processing",
-        message="File uploaded successfully"
+        message=f"File uploaded successfully ({upload.describe()})"
     )
 
 @app.post("/generate-analysis", response_model=ProcessingResponse)
-async def generate_analysis(background_tasks: BackgroundTasks, file: UploadFile): 
+async def generate_analysis(file: UploadFile, no_cache: bool = False): 
     if not file.filename.endswith('.txt'):
         raise HTTPException(status_code=400, detail="Only .txt files are supported for analysis generation")
     
@@ -172,25 +269,30 @@ async def generate_analysis(background_tasks: BackgroundTasks, file: UploadFile)
     file_path.parent.mkdir(parents=True, exist_ok=True)
     
     try:
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        upload = await save_upload(file, file_path, max_bytes=MAX_DOCUMENT_BYTES)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
 
-    active_tasks[task_id] = {"status": "processing"}
-    background_tasks.add_task(generate_analysis_task, task_id, file_path)
+    task_store.create(task_id, "analysis")
+    scheduler.submit(
+        task_id, "analysis", processor.analyze_transcript, file_path,
+        use_cache=not no_cache, cleanup=[file_path]
+    )
 
-    return ProcessingResponse(task_id=task_id, status="processing", message="Analysis generation started")
+    return ProcessingResponse(task_id=task_id, status="processing", message=f"Analysis generation started ({upload.describe()})")
 
 @app.post("/generate-key-images", response_model=ProcessingResponse)
 async def generate_key_images(
-    background_tasks: BackgroundTasks, 
     file: UploadFile, 
     analysis: Optional[UploadFile] = None
 ):
     # Check if the file is an MP4 video
     if not file.filename.endswith('.mp4'):
         raise HTTPException(status_code=400, detail="Only MP4 files are supported for keyframe extraction")
+    if analysis and not analysis.filename.endswith('.json'):
+        raise HTTPException(status_code=400, detail="Only .json files are supported for analysis")
 
     # Generate a unique task ID
     task_id = str(uuid.uuid4())
@@ -200,45 +302,48 @@ async def generate_key_images(
     file_path.parent.mkdir(parents=True, exist_ok=True)
     
     try:
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        upload = await save_upload(file, file_path, max_bytes=MAX_VIDEO_BYTES)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save video file: {str(e)}")
 
     # If an analysis JSON file is provided, save it as well
     analysis_path = None
     if analysis:
-        if not analysis.filename.endswith('.json'):
-            raise HTTPException(status_code=400, detail="Only .json files are supported for analysis")
-        
         analysis_path = Path(f"media_storage/analysis/{task_id}_{analysis.filename}")
         analysis_path.parent.mkdir(parents=True, exist_ok=True)
         
         try:
-            with analysis_path.open("wb") as buffer:
-                shutil.copyfileobj(analysis.file, buffer)
+            await save_upload(analysis, analysis_path, max_bytes=MAX_DOCUMENT_BYTES)
         except Exception as e:
+            # No task will run, so the video saved above would never be cleaned up
+            file_path.unlink(missing_ok=True)
+            if isinstance(e, HTTPException):
+                raise
             raise HTTPException(status_code=500, detail=f"Failed to save analysis file: {str(e)}")
 
     # Initialize task status
-    active_tasks[task_id] = {"status": "processing"}
+    task_store.create(task_id, "keyframes")
 
-    # Start the background task
-    background_tasks.add_task(get_images_task, task_id, file_path, analysis_path)
+    # Queue the job for the worker pool
+    scheduler.submit(
+        task_id, "keyframes", processor.extract_keyframes, file_path,
+        analysis_path=analysis_path, media_hash=upload.sha256, cleanup=[file_path]
+    )
 
     return ProcessingResponse(
         task_id=task_id,
         status="processing",
-        message="Keyframe extraction started"
+        message=f"Keyframe extraction started ({upload.describe()})"
     )
 
 @app.post("/upload", response_model=ProcessingResponse)
-async def upload_video(
-    background_tasks: BackgroundTasks,
-    file: UploadFile
-):
+async def upload_video(file: UploadFile, whisper_model: Optional[str] = None, stream: bool = False):
+    """``stream=true`` splits the audio so /transcript/{task_id}/stream gets its first segments early."""
     if not file.filename.endswith('.mp4'):
         raise HTTPException(status_code=400, detail="Only MP4 files are supported")
+    _validate_whisper_model(whisper_model)
 
     # Create unique task ID
     task_id = str(uuid.uuid4())
@@ -248,29 +353,36 @@ async def upload_video(
     file_path.parent.mkdir(parents=True, exist_ok=True)
     
     try:
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        upload = await save_upload(file, file_path, max_bytes=MAX_VIDEO_BYTES)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
 
     # Initialize task status
-    active_tasks[task_id] = {"status": "processing"}
+    task_store.create(task_id, "upload")
     
-    # Start processing in background
-    background_tasks.add_task(process_video_task, task_id, file_path)
+    # Queue the job for the worker pool
+    segment_broker.open(task_id)
+    scheduler.submit(
+        task_id, "upload", processor.process_media, file_path,
+        media_hash=upload.sha256, model_name=whisper_model, on_segments=segment_broker.publisher(task_id),
+        stream=stream,
+        cleanup=[file_path], on_finish=lambda: segment_broker.close(task_id)
+    )
 
     return ProcessingResponse(
         task_id=task_id,
         status="processing",
-        message="Video upload successful. Processing started."
+        message=f"Video upload successful ({upload.describe()}). Processing started."
     )
 
 @app.get("/status/{task_id}", response_model=ProcessingResponse)
 async def get_status(task_id: str):
-    if task_id not in active_tasks:
+    task_info = task_store.get(task_id)
+    if task_info is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    task_info = active_tasks[task_id]
     status = task_info["status"]
     
     message = "Processing in progress"
@@ -287,119 +399,224 @@ async def get_status(task_id: str):
 
 @app.get("/result/{task_id}")
 async def get_result(task_id: str):
-    if task_id not in active_tasks:
+    task_info = task_store.get(task_id)
+    if task_info is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    task_info = active_tasks[task_id]
     if task_info["status"] != "completed":
         raise HTTPException(
             status_code=400, 
             detail=f"Task is not completed. Current status: {task_info['status']}"
         )
+
+    result = await task_store.get_result_async(task_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Task result not found")
     
-    return JSONResponse(content=task_info["result"])
+    return JSONResponse(content=result)
 
 @app.get("/analysis/{task_id}")
 async def get_analysis(task_id: str):
-    if task_id not in active_tasks:
+    task_info = task_store.get(task_id)
+    if task_info is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    task_info = active_tasks[task_id]
     if task_info["status"] != "completed":
         raise HTTPException(
             status_code=400,
             detail=f"Task is not completed. Current status: {task_info['status']}"
         )
+
+    result = await task_store.get_result_async(task_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Task result not found")
     
-    analysis_path = Path(task_info["result"]["analysis"]) / f"ai_lecture_analysis.json"
-    if not analysis_path.exists():
-        raise HTTPException(status_code=404, detail="Analysis file not found")
+    # /generate-analysis stores the analysis itself; full pipeline results nest it
+    if task_info["kind"] == "analysis":
+        analysis = result
+    else:
+        analysis = result.get("analysis") if isinstance(result, dict) else None
+    if analysis is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
     
-    return FileResponse(analysis_path)
+    return JSONResponse(content=analysis)
 
-@app.get("/keyframe/{task_id}/{frame_number}")
-async def get_keyframe(task_id: str, frame_number: int):
-    if task_id not in active_tasks:
+async def _keyframes_dir(task_id: str) -> Path:
+    task_info = task_store.get(task_id)
+    if task_info is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    task_info = active_tasks[task_id]
     if task_info["status"] != "completed":
         raise HTTPException(
             status_code=400,
             detail=f"Task is not completed. Current status: {task_info['status']}"
         )
+
+    result = await task_store.get_result_async(task_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Task result not found")
     
-    keyframes_dir = Path(task_info["result"]["keyframes_dir"])
-    frames = list(keyframes_dir.glob("frame_*.jpg"))
-    
-    if not frames or frame_number >= len(frames):
+    # Full pipeline results are dicts; /generate-key-images stores the directory itself
+    return Path(result["keyframes_dir"] if isinstance(result, dict) else result)
+
+@app.get("/keyframes/{task_id}")
+async def get_keyframes(task_id: str):
+    """Manifest of a task's keyframes, for gallery views."""
+    keyframes_dir = await _keyframes_dir(task_id)
+    try:
+        return keyframe_index.manifest(keyframes_dir)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Keyframes not found")
+
+@app.get("/keyframe/{task_id}/{frame_number}")
+async def get_keyframe(
+    task_id: str,
+    frame_number: int,
+    width: Optional[int] = None,
+    format: str = "jpg"
+):
+    """One keyframe; ``width`` and ``format=webp`` select a cached downscaled/WebP variant."""
+    keyframes_dir = await _keyframes_dir(task_id)
+    try:
+        path = await keyframe_index.variant(keyframes_dir, frame_number, width=width, format=format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (FileNotFoundError, IndexError):
         raise HTTPException(status_code=404, detail="Keyframe not found")
+    except ffmpeg.Error as e:
+        raise HTTPException(status_code=500, detail=f"Failed to render keyframe: {describe_error(e)}")
     
-    return FileResponse(frames[frame_number])
+    return FileResponse(
+        path,
+        media_type="image/webp" if format == "webp" else "image/jpeg",
+        headers={"Cache-Control": "public, max-age=86400, immutable"}
+    )
 
 @app.get("/transcript/{task_id}")
-async def get_transcript(task_id: str):
-    if task_id not in active_tasks:
+async def get_transcript(task_id: str, start: Optional[float] = None, end: Optional[float] = None):
+    """The transcript file, or with ``start``/``end`` (seconds) only the segments in that range as JSON."""
+    task_info = task_store.get(task_id)
+    if task_info is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    task_info = active_tasks[task_id]
     if task_info["status"] != "completed":
         raise HTTPException(
             status_code=400,
             detail=f"Task is not completed. Current status: {task_info['status']}"
         )
+
+    result = await task_store.get_result_async(task_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Task result not found")
     
-    transcript_path = Path(task_info["result"]["transcript_path"])
+    transcript_path = Path(result["transcript_path"])
     if not transcript_path.exists():
         raise HTTPException(status_code=404, detail="Transcript file not found")
     
-    return FileResponse(transcript_path)
+    if start is None and end is None:
+        return FileResponse(transcript_path)
+    if (start is not None and start < 0) or (end is not None and end < 0):
+        raise HTTPException(status_code=400, detail="start and end must not be negative")
+    if start is not None and end is not None and end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+
+    # Older transcripts have their segment file built from the text on first use, which reads the whole file
+    store = await asyncio.to_thread(SegmentStore.for_transcript, transcript_path)
+    with store:
+        return {
+            "start": start,
+            "end": end,
+            "duration": store.duration,
+            "total_segments": len(store),
+            "segments": store.query(start, end),
+        }
+
+@app.get("/transcript/{task_id}/stream")
+async def stream_transcript(task_id: str):
+    """Server-sent events with each transcript segment as soon as it is decoded."""
+    if task_store.get(task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    if not segment_broker.has_channel(task_id):
+        raise HTTPException(status_code=404, detail="No live transcript for this task, use /transcript instead")
+
+    async def events():
+        async for segment in segment_broker.subscribe(task_id):
+            yield f"event: segment\ndata: {json.dumps(segment)}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/ws/transcript/{task_id}")
+async def transcript_socket(websocket: WebSocket, task_id: str):
+    """WebSocket variant of /transcript/{task_id}/stream."""
+    await websocket.accept()
+    if not segment_broker.has_channel(task_id):
+        await websocket.close(code=4404, reason="No live transcript for this task")
+        return
+    
+    try:
+        async for segment in segment_broker.subscribe(task_id):
+            await websocket.send_json({"event": "segment", **segment})
+        await websocket.send_json({"event": "done"})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+def _prep_inputs(request: ExamPrepRequest):
+    """Convert an ExamPrepRequest into the course materials and syllabus dicts the assistant expects."""
+    course_materials = [{
+        "filename": m.filename,
+        "type": m.type,
+        "description": m.description,
+        "date_added": m.date_added,
+        "topics": m.topics,
+        # "difficulty": m.difficulty
+    } for m in request.course_materials]
+    syllabus = {
+        "course_name": request.syllabus.course_name,
+        "exam_type": request.syllabus.exam_type,
+        "exam_date": request.syllabus.exam_date,
+        "current_date": str(datetime.now().date()),
+        "duration": request.syllabus.duration,
+        "format": request.syllabus.format,
+        "modules": {
+            name: {
+                "weight": module.weight,
+                "objectives": module.objectives
+            } for name, module in request.syllabus.modules.items()
+        }
+    }
+    return course_materials, syllabus
 
 @app.post("/get-prep-assistance", response_model=ProcessingResponse)
 async def get_prep_assistance(
     background_tasks: BackgroundTasks,
-    request: ExamPrepRequest  # Updated to use the new request model
+    request: ExamPrepRequest,  # Updated to use the new request model
+    no_cache: bool = False,
+    per_module: bool = False
 ):
     task_id = str(uuid.uuid4())
-    active_tasks[task_id] = {"status": "processing"}
+    task_store.create(task_id, "prep_assistance")
 
     async def generate_assistance_task(task_id: str, request: ExamPrepRequest):
         try:
             # Generate study guide using ExamPrepAssistant
+            course_materials, syllabus = _prep_inputs(request)
             study_guide = await prep_assistant.generate_study_guide(
-                course_materials=[{
-                    "filename": m.filename,
-                    "type": m.type,
-                    "description": m.description,
-                    "date_added": m.date_added,
-                    "topics": m.topics,
-                    # "difficulty": m.difficulty
-                } for m in request.course_materials],
-                syllabus={
-                    "course_name": request.syllabus.course_name,
-                    "exam_type": request.syllabus.exam_type,
-                    "exam_date": request.syllabus.exam_date,
-                    "current_date": str(datetime.now().date()),
-                    "duration": request.syllabus.duration,
-                    "format": request.syllabus.format,
-                    "modules": {
-                        name: {
-                            "weight": module.weight,
-                            "objectives": module.objectives
-                        } for name, module in request.syllabus.modules.items()
-                    }
-                }
+                course_materials=course_materials,
+                syllabus=syllabus,
+                use_cache=not no_cache,
+                per_module=per_module
             )
             
-            active_tasks[task_id] = {
-                "status": "completed",
-                "result": study_guide
-            }
+            await task_store.complete_async(task_id, study_guide)
         except Exception as e:
-            active_tasks[task_id] = {
-                "status": "failed",
-                "error": str(e)
-            }
+            task_store.fail(task_id, str(e))
     
     background_tasks.add_task(generate_assistance_task, task_id, request)
     
@@ -409,16 +626,33 @@ async def get_prep_assistance(
         message="Study guide generation in progress"
     )
 
+@app.post("/get-prep-assistance/stream")
+async def stream_prep_assistance(request: ExamPrepRequest, no_cache: bool = False):
+    """Server-sent events with each study guide module as soon as it is generated."""
+    course_materials, syllabus = _prep_inputs(request)
+
+    async def events():
+        async for event in prep_assistant.stream_study_guide(
+            course_materials, syllabus, use_cache=not no_cache
+        ):
+            name = event.pop("event")
+            yield f"event: {name}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/assistance-result/{task_id}")
 async def get_assistance_result(task_id: str):
-    if task_id not in active_tasks:
+    task_info = task_store.get(task_id)
+    if task_info is None:
         raise HTTPException(
             status_code=404, 
             detail="Task not found"
         )
     
-    task_info = active_tasks[task_id]
-    
     if task_info["status"] == "failed":
         raise HTTPException(
             status_code=500,
@@ -433,19 +667,85 @@ async def get_assistance_result(task_id: str):
                 "message": "Task is still processing"
             }
         )
+
+    result = await task_store.get_result_async(task_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Task result not found")
     
-    return JSONResponse(content=task_info["result"])
+    return JSONResponse(content=result)
+
+@app.post("/routines/batch")
+async def generate_routines_batch(request: RoutineBatchRequest, no_cache: bool = False):
+    """Server-sent events with each student's routine in completion order."""
+    if not request.students:
+        raise HTTPException(status_code=400, detail="No students given")
+
+    preferences_list = [StudentPreferences(**student.dict()) for student in request.students]
+    concurrency = max(1, min(request.concurrency, ROUTINE_BATCH_MAX_CONCURRENCY))
+
+    async def events():
+        async for result in routine_assistant.generate_routines_batch(
+            preferences_list, concurrency=concurrency, use_cache=not no_cache
+        ):
+            yield f"event: routine\ndata: {json.dumps(result, default=str)}\n\n"
+        yield f"event: done\ndata: {json.dumps({'count': len(preferences_list)})}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # @app.get("/routine/{task_id}", response_model=ProcessingResponse)
 # async def get_routine(task_id: str):
 #     if task_id not in active_tasks:
 #         raise Excep
 
+# Uploaded files are saved as "{task_id}_{filename}", so lecture IDs start with the task that transcribed them
+_LECTURE_TASK_ID = re.compile(r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})_")
+
+@app.get("/search")
+async def search_transcripts(q: str, limit: int = 10, lecture_id: Optional[str] = None):
+    """BM25 search over all transcripts; each hit is one segment with its lecture and timestamps.
+
+    ``task_id`` in a hit can be passed to ``/transcript/{task_id}?start=&end=`` for context.
+    """
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+
+    start_time = time.perf_counter()
+    hits = await asyncio.to_thread(search_index.search, q, limit, lecture_id)
+    for hit in hits:
+        match = _LECTURE_TASK_ID.match(hit["lecture_id"])
+        hit["task_id"] = match.group(1) if match else None
+    return {
+        "query": q,
+        "took_ms": round((time.perf_counter() - start_time) * 1000, 2),
+        "hits": hits,
+    }
+
+@app.get("/search/stats")
+async def search_stats():
+    return search_index.stats()
+
+@app.get("/llm-cache/stats")
+async def get_llm_cache_stats():
+    return llm_cache.stats()
+
+@app.get("/llm-gateway/stats")
+async def get_llm_gateway_stats():
+    return llm_gateway.stats()
+
+@app.get("/whisper-batcher/stats")
+async def get_whisper_batcher_stats():
+    if whisper_batcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **whisper_batcher.stats()}
+
 # Optional: Endpoint to clean up completed tasks
 @app.delete("/cleanup-task/{task_id}")
 async def cleanup_task(task_id: str):
-    if task_id in active_tasks:
-        del active_tasks[task_id]
+    if task_store.delete(task_id):
         return {"message": f"Task {task_id} cleaned up successfully"}
     raise HTTPException(status_code=404, detail="Task not found")
 
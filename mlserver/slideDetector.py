@@ -0,0 +1,128 @@
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import ffmpeg
+import numpy as np
+
+from ffmpegRunner import run_ffmpeg
+
+_CLOCK = re.compile(r"^(?:(\d+):)?(\d{1,2}):(\d{1,2}(?:\.\d+)?)$")
+_SECONDS = re.compile(r"^(\d+(?:\.\d+)?)\s*(?:s|sec|secs|seconds)?$")
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """Parse ``HH:MM:SS``, ``MM:SS``, ``483.00s`` or plain seconds into seconds.
+
+    Surrounding brackets and a trailing ``-> end`` range are ignored, so
+    ``"[00:08:03]"`` and ``"483.00s -> 490.00s"`` both work. Returns None
+    when nothing sensible can be read.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value) if value >= 0 else None
+    if not isinstance(value, str):
+        return None
+
+    text = value.strip().strip("[]()").split("->")[0].split(" - ")[0].strip().lower()
+    match = _CLOCK.match(text)
+    if match:
+        hours, minutes, seconds = match.groups()
+        return int(hours or 0) * 3600 + int(minutes) * 60 + float(seconds)
+    match = _SECONDS.match(text)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+def format_timestamp(seconds: float) -> str:
+    """Format seconds as ``HH:MM:SS.mmm``, which ffmpeg's ``-ss`` accepts and sorts lexically."""
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600 * 1000)
+    minutes, millis = divmod(millis, 60 * 1000)
+    return f"{hours:02d}:{minutes:02d}:{millis / 1000:06.3f}"
+
+
+def normalize_timestamp(value: Any) -> Optional[str]:
+    seconds = parse_timestamp(value)
+    return format_timestamp(seconds) if seconds is not None else None
+
+
+def find_slide_changes(
+    frames: np.ndarray,
+    fps: float,
+    threshold: float = 0.08,
+    min_gap_seconds: float = 5.0,
+    max_slides: int = 60
+) -> List[float]:
+    """Return the times (seconds) at which the picture changes substantially.
+
+    ``frames`` is an ``(n, height, width)`` uint8 array of grayscale frames.
+    A change is the mean absolute difference of consecutive frames plus the
+    L1 distance of their 32-bin histograms, both in 0..1; the histogram term
+    catches slide transitions that keep the layout but change the content
+    density. Changes closer than ``min_gap_seconds`` to a stronger one are
+    dropped, and at most ``max_slides`` (the strongest) are kept. The first
+    frame always counts as a slide.
+    """
+    if len(frames) == 0:
+        return []
+
+    pixels = frames.reshape(len(frames), -1)
+    diffs = np.abs(np.diff(pixels.astype(np.int16), axis=0)).mean(axis=1) / 255.0
+
+    # 256 levels -> 32 bins; one pass per bin keeps temporaries at one byte per pixel
+    bins = pixels >> 3
+    hist = np.stack([(bins == b).sum(axis=1) for b in range(32)], axis=1) / pixels.shape[1]
+    hist_diffs = np.abs(np.diff(hist, axis=0)).sum(axis=1) / 2.0
+
+    scores = diffs + hist_diffs
+    candidates = np.nonzero(scores > threshold)[0]
+
+    # Strongest changes first; suppress weaker ones within the minimum gap
+    min_gap = int(min_gap_seconds * fps)
+    chosen: List[int] = []
+    for index in candidates[np.argsort(-scores[candidates])]:
+        if all(abs(index - other) > min_gap for other in chosen):
+            chosen.append(int(index))
+        if len(chosen) >= max_slides - 1:
+            break
+
+    # Frame index + 1 is the first frame showing the new slide
+    return [0.0] + sorted((index + 1) / fps for index in chosen)
+
+
+async def detect_slides(
+    mp4_path: Path,
+    fps: float = 1.0,
+    width: int = 128,
+    height: int = 72,
+    threshold: float = 0.08,
+    min_gap_seconds: float = 5.0,
+    max_slides: int = 60,
+    timeout: Optional[float] = None
+) -> List[Dict[str, str]]:
+    """Find slide transitions in a video and return them as key moments.
+
+    ffmpeg decodes ``fps`` downscaled grayscale frames per second straight
+    into a NumPy buffer (about 33 MB per hour at the defaults), so no LLM
+    output is needed. Each moment is ``{"timestamp", "description"}``.
+    """
+    stream = (
+        ffmpeg
+        .input(str(mp4_path))
+        .video
+        .filter('fps', fps=fps)
+        .filter('scale', width, height)
+        .output('pipe:', format='rawvideo', pix_fmt='gray')
+    )
+    out, _ = await run_ffmpeg(stream, timeout=timeout, capture_stdout=True)
+    frames = np.frombuffer(out, np.uint8)
+    frames = frames[:len(frames) - len(frames) % (width * height)].reshape(-1, height, width)
+
+    times = find_slide_changes(frames, fps, threshold, min_gap_seconds, max_slides)
+    # Grab each slide a moment after the transition so fades have settled
+    settle = min(1.0, 0.5 / fps)
+    return [
+        {"timestamp": format_timestamp(t + (settle if t else 0.0)), "description": f"Slide {i + 1}"}
+        for i, t in enumerate(times)
+    ]
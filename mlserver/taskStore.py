@@ -0,0 +1,193 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+class TaskStore:
+    """Disk-backed task registry.
+
+    Status rows live in a SQLite database (WAL mode) and task results are
+    written to individual JSON files, so the process only ever holds the
+    small status rows it is currently serving. Coroutines use
+    ``complete_async``/``get_result_async`` so large results are serialized
+    off the event loop.
+    """
+
+    def __init__(
+        self,
+        base_dir: str = "media_storage",
+        ttl_seconds: int = 24 * 60 * 60,
+        max_finished_tasks: int = 1000,
+        evict_interval: int = 60
+    ):
+        """Open (or create) the task database under ``base_dir``."""
+        self.base_dir = Path(base_dir)
+        self.results_dir = self.base_dir / "results"
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.base_dir / "tasks.db"
+
+        self.ttl_seconds = ttl_seconds
+        self.max_finished_tasks = max_finished_tasks
+        self.evict_interval = evict_interval
+        self._last_eviction = 0.0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT,
+                result_path TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_tasks_status_updated ON tasks (status, updated_at)"
+        )
+        self._conn.commit()
+
+    def _execute(self, query: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+            self._conn.commit()
+            return cursor
+
+    def _fetchone(self, query: str, params: tuple = ()) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()
+
+    def recover_interrupted(self) -> int:
+        """Fail tasks that were still running when the previous server process exited."""
+        cursor = self._execute(
+            "UPDATE tasks SET status = 'failed', error = ?, updated_at = ? WHERE status = 'processing'",
+            ("Interrupted by server restart", time.time())
+        )
+        return cursor.rowcount
+
+    def create(self, task_id: str, kind: str) -> None:
+        """Register a new task in the ``processing`` state."""
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO tasks (task_id, kind, status, created_at, updated_at, accessed_at) "
+            "VALUES (?, ?, 'processing', ?, ?, ?)",
+            (task_id, kind, now, now, now)
+        )
+        self.maybe_evict()
+
+    def complete(self, task_id: str, result: Any) -> None:
+        """Persist a task result to disk and mark the task completed."""
+        result_path = self.results_dir / f"{task_id}.json"
+        tmp_path = result_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, default=str)
+        tmp_path.replace(result_path)
+
+        now = time.time()
+        self._execute(
+            "UPDATE tasks SET status = 'completed', error = NULL, result_path = ?, "
+            "updated_at = ?, accessed_at = ? WHERE task_id = ?",
+            (str(result_path), now, now, task_id)
+        )
+
+    async def complete_async(self, task_id: str, result: Any) -> None:
+        await asyncio.to_thread(self.complete, task_id, result)
+
+    def fail(self, task_id: str, error: str) -> None:
+        """Mark a task as failed with the given error message."""
+        now = time.time()
+        self._execute(
+            "UPDATE tasks SET status = 'failed', error = ?, updated_at = ?, accessed_at = ? WHERE task_id = ?",
+            (error, now, now, task_id)
+        )
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Return the status row of a task, or None if it is unknown."""
+        row = self._fetchone(
+            "SELECT task_id, kind, status, error, created_at, updated_at FROM tasks WHERE task_id = ?",
+            (task_id,)
+        )
+        if row is None:
+            return None
+        self._execute("UPDATE tasks SET accessed_at = ? WHERE task_id = ?", (time.time(), task_id))
+        return dict(row)
+
+    def get_result(self, task_id: str) -> Optional[Any]:
+        """Load the stored result of a completed task from disk."""
+        row = self._fetchone("SELECT result_path FROM tasks WHERE task_id = ?", (task_id,))
+        if row is None or row["result_path"] is None:
+            return None
+
+        result_path = Path(row["result_path"])
+        if not result_path.exists():
+            return None
+        with open(result_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    async def get_result_async(self, task_id: str) -> Optional[Any]:
+        return await asyncio.to_thread(self.get_result, task_id)
+
+    def delete(self, task_id: str) -> bool:
+        """Remove a task and its result file. Returns False if the task did not exist."""
+        row = self._fetchone("SELECT result_path FROM tasks WHERE task_id = ?", (task_id,))
+        if row is None:
+            return False
+        self._remove_result_file(row["result_path"])
+        self._execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+        return True
+
+    def maybe_evict(self) -> None:
+        """Run eviction if the last pass is older than ``evict_interval``."""
+        if time.time() - self._last_eviction >= self.evict_interval:
+            self.evict()
+
+    def evict(self) -> int:
+        """Evict finished tasks past their TTL, then the least recently used beyond the cap."""
+        self._last_eviction = time.time()
+        cutoff = self._last_eviction - self.ttl_seconds
+
+        with self._lock:
+            expired = self._conn.execute(
+                "SELECT task_id, result_path FROM tasks "
+                "WHERE status != 'processing' AND updated_at < ?",
+                (cutoff,)
+            ).fetchall()
+            overflow = self._conn.execute(
+                "SELECT task_id, result_path FROM tasks WHERE status != 'processing' "
+                "AND updated_at >= ? ORDER BY accessed_at DESC LIMIT -1 OFFSET ?",
+                (cutoff, self.max_finished_tasks)
+            ).fetchall()
+
+        evicted = list(expired) + list(overflow)
+        for row in evicted:
+            self._remove_result_file(row["result_path"])
+
+        if evicted:
+            with self._lock:
+                self._conn.executemany(
+                    "DELETE FROM tasks WHERE task_id = ?",
+                    [(row["task_id"],) for row in evicted]
+                )
+                self._conn.commit()
+        return len(evicted)
+
+    @staticmethod
+    def _remove_result_file(result_path: Optional[str]) -> None:
+        if not result_path:
+            return
+        try:
+            Path(result_path).unlink(missing_ok=True)
+        except Exception as e:
+            print(f"Warning: Failed to remove result file {result_path}: {str(e)}")
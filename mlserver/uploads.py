@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+CHUNK_SIZE = 1024 * 1024  # 1 MiB
+
+
+@dataclass
+class UploadInfo:
+    path: Path
+    size: int
+    sha256: str
+    elapsed: float
+
+    @property
+    def throughput(self) -> float:
+        """Ingestion throughput in MiB/s."""
+        return (self.size / (1024 * 1024)) / self.elapsed if self.elapsed > 0 else 0.0
+
+    def describe(self) -> str:
+        return f"{self.size / (1024 * 1024):.1f} MiB in {self.elapsed:.2f}s, {self.throughput:.1f} MiB/s"
+
+
+def _write_chunk(buffer: BinaryIO, hasher, chunk: bytes):
+    buffer.write(chunk)
+    hasher.update(chunk)
+
+
+async def save_upload(upload: UploadFile, dest: Path, max_bytes: int) -> UploadInfo:
+    """Copy an upload to ``dest`` in chunks without blocking the event loop.
+
+    Starlette has already spooled the request body to a temporary file
+    before the handler runs, so the per-file ``max_bytes`` check, the hash
+    and the reported throughput all apply to that local copy; oversized
+    bodies are stopped earlier, while they arrive, by
+    ``RequestSizeLimitMiddleware``. Disk writes and hashing run in a worker
+    thread and the partial file is removed on any failure.
+    """
+    declared_size = getattr(upload, "size", None)
+    if declared_size is not None and declared_size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File exceeds the {max_bytes} byte upload limit")
+
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    hasher = hashlib.sha256()
+    size = 0
+    start_time = time.perf_counter()
+
+    buffer = await asyncio.to_thread(dest.open, "wb")
+    try:
+        while True:
+            chunk = await upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"File exceeds the {max_bytes} byte upload limit")
+            await asyncio.to_thread(_write_chunk, buffer, hasher, chunk)
+    except BaseException:
+        await asyncio.to_thread(buffer.close)
+        dest.unlink(missing_ok=True)
+        raise
+    await asyncio.to_thread(buffer.close)
+
+    info = UploadInfo(path=dest, size=size, sha256=hasher.hexdigest(), elapsed=time.perf_counter() - start_time)
+    print(f"Received {dest.name}: {info.describe()}")
+    return info
+
+
+class RequestSizeLimitMiddleware:
+    """Reject request bodies larger than ``max_bytes`` while they are received.
+
+    A declared ``Content-Length`` over the limit is refused before any of
+    the body is read. Otherwise (e.g. chunked uploads) the received bytes
+    are counted and the request fails with 413 as soon as the limit is
+    passed, so an oversized upload is never spooled to disk in full.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body exceeds the {self.max_bytes} byte limit"
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised inside the body parser, so FastAPI answers with this status
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,304 @@
+import asyncio
+import functools
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from modelRegistry import WhisperModelRegistry
+from taskStore import TaskStore
+
+# Per-process model registry, created by _init_worker inside each pool process
+_worker_registry: Optional[WhisperModelRegistry] = None
+
+
+class SharedAudio:
+    """16-bit PCM samples in a shared memory block, handed to pool processes by name.
+
+    Slices are views on the same block, and pickling one sends only the
+    block name and sample bounds, so chunks and batch windows cross the
+    process boundary without copying audio. Whisper's float32 copy is made
+    by ``np.asarray`` in whichever process consumes the samples. The
+    creating process owns the block and must ``close`` it when done.
+    """
+
+    def __init__(self, name: str, start: int, stop: int):
+        self.name = name
+        self.start = start
+        self.stop = stop
+        self._block: Optional[shared_memory.SharedMemory] = None
+        self._attached = False
+        self._owner = False
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SharedAudio":
+        """Copy raw s16le PCM into a new shared memory block."""
+        block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        block.buf[:len(data)] = data
+        audio = cls(block.name, 0, len(data) // 2)
+        audio._block, audio._attached, audio._owner = block, True, True
+        return audio
+
+    def __reduce__(self):
+        return SharedAudio, (self.name, self.start, self.stop)
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __getitem__(self, key: slice) -> "SharedAudio":
+        start, stop, step = key.indices(len(self))
+        if step != 1:
+            raise ValueError("SharedAudio only supports contiguous slices")
+        view = SharedAudio(self.name, self.start + start, self.start + max(start, stop))
+        view._block = self._block
+        return view
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        if self._block is None:
+            self._block = shared_memory.SharedMemory(name=self.name)
+            self._attached = True
+        samples = np.ndarray((len(self),), dtype=np.int16, buffer=self._block.buf, offset=2 * self.start)
+        result = samples.astype(np.float32)
+        result /= 32768.0
+        return result if dtype is None else result.astype(dtype, copy=False)
+
+    def close(self) -> None:
+        """Detach from the block, and free it if this is the object that created it."""
+        if self._block is not None and self._attached:
+            self._block.close()
+            if self._owner:
+                self._block.unlink()
+        self._block = None
+
+
+def _load_audio(audio: Any) -> Any:
+    """Turn shared audio into the float32 array Whisper expects; paths and arrays pass through."""
+    if not isinstance(audio, SharedAudio):
+        return audio
+    samples = np.asarray(audio)
+    audio.close()
+    return samples
+
+
+def _init_worker(num_threads: int, memory_budget_mb: int, warm_up: List[str]):
+    """Set up the model registry of a worker process and preload ``warm_up`` models."""
+    global _worker_registry
+    import torch
+
+    # Split the cores between workers instead of letting every process grab all of them
+    torch.set_num_threads(max(1, num_threads))
+    _worker_registry = WhisperModelRegistry(memory_budget_mb=memory_budget_mb)
+    _worker_registry.warm_up(warm_up)
+    print(f"Whisper worker {os.getpid()} ready on {_worker_registry.device}", flush=True)
+
+
+def _transcribe(model_name: str, audio: Any, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a Whisper transcription inside a worker process."""
+    model = _worker_registry.get(model_name)
+    return model.transcribe(_load_audio(audio), fp16=_worker_registry.device == "cuda", **options)
+
+
+def _tokens_to_segments(tokens: List[int], tokenizer, duration: float) -> List[Dict[str, Any]]:
+    """Turn one window's decoded tokens into ``start``/``end``/``text`` segments."""
+    segments = []
+    start = None
+    text_tokens: List[int] = []
+    for token in tokens:
+        if token >= tokenizer.timestamp_begin:
+            time = (token - tokenizer.timestamp_begin) * 0.02
+            if text_tokens:
+                segments.append({"start": start or 0.0, "end": time, "tokens": text_tokens})
+                text_tokens = []
+            start = time
+        elif token < tokenizer.eot:
+            text_tokens.append(token)
+    if text_tokens:
+        segments.append({"start": start or 0.0, "end": duration, "tokens": text_tokens})
+
+    for segment in segments:
+        segment["text"] = tokenizer.decode(segment["tokens"])
+    return segments
+
+
+def _decode_windows(model_name: str, windows: List[Any], language: str) -> List[Dict[str, Any]]:
+    """Decode a batch of audio windows (each at most 30s) in one batched forward pass."""
+    import torch
+    import whisper
+    from whisper.audio import N_FRAMES, N_SAMPLES, SAMPLE_RATE
+    from whisper.tokenizer import get_tokenizer
+
+    model = _worker_registry.get(model_name)
+    windows = [_load_audio(window) for window in windows]
+    mel = torch.stack([
+        whisper.pad_or_trim(whisper.log_mel_spectrogram(
+            whisper.pad_or_trim(torch.from_numpy(window), N_SAMPLES), model.dims.n_mels
+        ), N_FRAMES)
+        for window in windows
+    ]).to(model.device)
+
+    options = whisper.DecodingOptions(
+        language=language, fp16=_worker_registry.device == "cuda", without_timestamps=False
+    )
+    results = whisper.decode(model, mel, options)
+    tokenizer = get_tokenizer(
+        model.is_multilingual, num_languages=model.num_languages, language=language, task="transcribe"
+    )
+    return [
+        {
+            "segments": _tokens_to_segments(result.tokens, tokenizer, len(window) / SAMPLE_RATE),
+            "avg_logprob": result.avg_logprob,
+            "no_speech_prob": result.no_speech_prob,
+            "compression_ratio": result.compression_ratio,
+            "temperature": result.temperature,
+        }
+        for window, result in zip(windows, results)
+    ]
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class WhisperPool:
+    """Fixed-size pool of processes, each with its own lazily loaded Whisper models."""
+
+    def __init__(
+        self,
+        num_workers: int = 1,
+        model_name: str = "base",
+        memory_budget_mb: int = 4096,
+        warm_up: Iterable[str] = ()
+    ):
+        self.num_workers = num_workers
+        self.model_name = model_name
+        threads_per_worker = (os.cpu_count() or 1) // num_workers
+        self.executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(threads_per_worker, memory_budget_mb, list(warm_up))
+        )
+
+    async def start(self):
+        """Spawn the worker processes now instead of on the first transcription."""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[
+            loop.run_in_executor(self.executor, _ping) for _ in range(self.num_workers)
+        ])
+
+    async def transcribe(self, audio: Any, model_name: Optional[str] = None, **options) -> Dict[str, Any]:
+        """Transcribe ``audio`` (a path, sample array or ``SharedAudio``) on one of the pool processes."""
+        if isinstance(audio, Path):
+            audio = str(audio)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(_transcribe, model_name or self.model_name, audio, options)
+        )
+
+    async def decode_windows(self, model_name: Optional[str], windows: List[Any], language: str) -> List[Dict[str, Any]]:
+        """Decode a batch of <=30s windows on one of the pool processes."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            functools.partial(_decode_windows, model_name or self.model_name, windows, language)
+        )
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class JobScheduler:
+    """Priority queue of media jobs drained by a fixed number of workers.
+
+    Jobs are plain coroutine functions. Their result (or error) is written to
+    the task store and any temporary files passed as ``cleanup`` are removed
+    once the job has finished.
+    """
+
+    # Lower value runs first: cheap LLM-only jobs jump ahead of full pipelines
+    DEFAULT_PRIORITIES = {
+        "analysis": 0,
+        "keyframes": 1,
+        "transcript": 2,
+        "upload": 3,
+    }
+
+    def __init__(
+        self,
+        task_store: TaskStore,
+        num_workers: int = 1,
+        priorities: Optional[Dict[str, int]] = None
+    ):
+        self.task_store = task_store
+        self.num_workers = num_workers
+        self.priorities = {**self.DEFAULT_PRIORITIES, **(priorities or {})}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._counter = itertools.count()
+
+    async def start(self):
+        """Start the worker coroutines on the running event loop."""
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.num_workers)
+        ]
+
+    async def stop(self):
+        """Cancel the workers. Queued jobs are left in the task store as processing."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def submit(
+        self,
+        task_id: str,
+        kind: str,
+        func: Callable[..., Awaitable[Any]],
+        *args,
+        cleanup: Iterable[Optional[Path]] = (),
+        on_finish: Optional[Callable[[], None]] = None,
+        **kwargs
+    ) -> int:
+        """Queue a job and return the number of jobs waiting ahead of it.
+
+        ``on_finish`` is called once the job has finished, whatever its outcome.
+        """
+        if self._queue is None:
+            raise RuntimeError("JobScheduler has not been started")
+
+        position = self._queue.qsize()
+        job = (task_id, func, args, kwargs, [p for p in cleanup if p is not None], on_finish)
+        self._queue.put_nowait((self.priorities.get(kind, len(self.priorities)), next(self._counter), job))
+        return position
+
+    async def _worker(self, worker_id: int):
+        while True:
+            _, _, (task_id, func, args, kwargs, cleanup, on_finish) = await self._queue.get()
+            try:
+                result = await func(*args, **kwargs)
+                await self.task_store.complete_async(task_id, result)
+            except asyncio.CancelledError:
+                self.task_store.fail(task_id, "Cancelled during shutdown")
+                raise
+            except Exception as e:
+                self.task_store.fail(task_id, str(e))
+            finally:
+                for path in cleanup:
+                    try:
+                        if path.exists():
+                            path.unlink()
+                    except Exception as e:
+                        print(f"Warning: Failed to cleanup {path}: {str(e)}")
+                if on_finish is not None:
+                    on_finish()
+                self._queue.task_done()